@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+"""Benchmark the extraction pipeline end-to-end against the fake backend."""
+import argparse
+import json
+import os
+import pathlib
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from extractflashcards import main as extraction_main
+
+SIZE_RE = re.compile(r"^(?P<number>[0-9]+)(?P<unit>B|KB|MB|GB)$")
+
+UNIT_TO_BYTES = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+
+def parse_size(text: str) -> Optional[int]:
+    """
+    Parse the size such as ``10KB`` to bytes.
+
+    Return None if the size is invalid.
+    """
+    mtch = SIZE_RE.match(text)
+    if mtch is None:
+        return None
+
+    return int(mtch.group("number")) * UNIT_TO_BYTES[mtch.group("unit")]
+
+
+def generate_corpus(path: pathlib.Path, size: int, seed: int) -> None:
+    """Generate a deterministic synthetic corpus of about ``size`` bytes."""
+    rng = random.Random(seed)
+    alphabet = "абвгдежзийклмнопрстуфхцчшщыэюя"
+
+    vocabulary = [
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(2, 10)))
+        for _ in range(20000)
+    ]
+
+    written = 0
+    with path.open("wt", encoding="utf-8") as fid:
+        while written < size:
+            words = rng.choices(vocabulary, k=rng.randint(4, 12))
+            line = " ".join(words).capitalize() + ".\n"
+            fid.write(line)
+            written += len(line.encode("utf-8"))
+
+
+def run_benchmark(
+    corpus_path: pathlib.Path,
+    output_dir: pathlib.Path,
+    fake_latency: float,
+    fake_seed: int,
+    max_concurrency: int,
+    extra_args: List[str],
+) -> Dict[str, Any]:
+    """Run the extraction on the ``corpus_path`` and measure it."""
+    output_path = output_dir / f"{corpus_path.stem}.csv"
+    if output_path.exists():
+        output_path.unlink()
+
+    batch_count = 0
+    with corpus_path.open("rt", encoding="utf-8") as fid:
+        for _, error in extraction_main.iter_batches(
+            lines=enumerate(extraction_main.iter_lines(fid), start=1),
+            max_batch_length=500,
+        ):
+            if error is not None:
+                raise RuntimeError(
+                    f"Failed to split {corpus_path} into batches: {error}"
+                )
+
+            batch_count += 1
+
+    cmd = [
+        sys.executable,
+        "-m",
+        "extractflashcards.main",
+        "--backend",
+        "fake",
+        "--fake_latency",
+        str(fake_latency),
+        "--fake_seed",
+        str(fake_seed),
+        "--max_concurrency",
+        str(max_concurrency),
+        "--text_path",
+        str(corpus_path),
+        "--output_path",
+        str(output_path),
+    ] + extra_args
+
+    start = time.perf_counter()
+    time_to_first_row = None  # type: Optional[float]
+
+    with subprocess.Popen(cmd) as proc:
+        while True:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            if pid != 0:
+                break
+
+            if time_to_first_row is None and output_path.exists():
+                with output_path.open("rt", encoding="utf-8") as fid:
+                    # NOTE (mristin):
+                    # The first line is the header, so we skip it.
+                    fid.readline()
+                    if fid.readline() != "":
+                        time_to_first_row = time.perf_counter() - start
+
+            time.sleep(0.005)
+
+        # NOTE (mristin):
+        # We reaped the child ourselves, so we need to tell Popen about it.
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+    duration = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        raise RuntimeError(
+            f"The extraction failed with exit code {proc.returncode}: {cmd}"
+        )
+
+    with output_path.open("rt", encoding="utf-8") as fid:
+        row_count = sum(1 for _ in fid) - 1
+
+    return {
+        "corpus_bytes": corpus_path.stat().st_size,
+        "batches": batch_count,
+        "rows": row_count,
+        "duration_seconds": duration,
+        "batches_per_second": batch_count / duration,
+        "rows_per_second": row_count / duration,
+        "time_to_first_row_seconds": time_to_first_row,
+        # NOTE (mristin):
+        # The maxrss is given in kilobytes on Linux.
+        "peak_rss_bytes": rusage.ru_maxrss * 1024,
+    }
+
+
+def main() -> int:
+    """Execute the main routine."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        help="Sizes of the synthetic corpora, e.g., 10KB, 1MB or 50MB",
+        nargs="+",
+        default=["10KB", "1MB", "50MB"],
+    )
+    parser.add_argument(
+        "--fake_latency",
+        help="Mean latency of a request to the fake backend in seconds",
+        type=float,
+        default=0.05,
+    )
+    parser.add_argument(
+        "--fake_seed",
+        help="Seed of the random latencies and failures of the fake backend",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--max_concurrency",
+        help="Maximum number of prompts in flight",
+        type=int,
+        default=64,
+    )
+    parser.add_argument(
+        "--output_path",
+        help="Path to the JSON report. If not specified, output to STDOUT",
+    )
+    parser.add_argument(
+        "extra_args",
+        help="Further arguments passed on to extract-flash-cards after --",
+        nargs=argparse.REMAINDER,
+    )
+
+    args = parser.parse_args()
+
+    sizes = []  # type: List[int]
+    for text in args.sizes:
+        size = parse_size(text)
+        if size is None:
+            print(f"Invalid size in --sizes: {text!r}", file=sys.stderr)
+            return 1
+
+        sizes.append(size)
+
+    extra_args = [arg for arg in args.extra_args if arg != "--"]
+
+    results = []  # type: List[Dict[str, Any]]
+
+    with tempfile.TemporaryDirectory() as tmp_dir_str:
+        tmp_dir = pathlib.Path(tmp_dir_str)
+
+        for size_text, size in zip(args.sizes, sizes):
+            corpus_path = tmp_dir / f"corpus-{size_text}.txt"
+            generate_corpus(path=corpus_path, size=size, seed=size)
+
+            print(f"Benchmarking the corpus of {size_text}...", file=sys.stderr)
+            result = run_benchmark(
+                corpus_path=corpus_path,
+                output_dir=tmp_dir,
+                fake_latency=float(args.fake_latency),
+                fake_seed=int(args.fake_seed),
+                max_concurrency=int(args.max_concurrency),
+                extra_args=extra_args,
+            )
+            result["size"] = size_text
+            results.append(result)
+
+    report = json.dumps(
+        {
+            "fake_latency": float(args.fake_latency),
+            "fake_seed": int(args.fake_seed),
+            "max_concurrency": int(args.max_concurrency),
+            "extra_args": extra_args,
+            "results": results,
+        },
+        indent=2,
+    )
+
+    if args.output_path is None:
+        print(report)
+    else:
+        pathlib.Path(args.output_path).write_text(report + "\n", encoding="utf-8")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""Provide the backends which complete the prompts."""
+
+import abc
+import asyncio
+import random
+import re
+import zlib
+from typing import Any, AsyncIterator, List, Mapping, Optional, Sequence, Set
+
+import openai
+from icontract import require
+
+from extractflashcards import tokenizing
+
+
+class Completion:
+    """Represent the answer of a backend to a prompt."""
+
+    @require(lambda prompt_tokens: prompt_tokens >= 0)
+    @require(lambda completion_tokens: completion_tokens >= 0)
+    @require(lambda prompt_tokens, cached_tokens: 0 <= cached_tokens <= prompt_tokens)
+    def __init__(
+        self,
+        answer: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int = 0,
+    ) -> None:
+        """
+        Initialize with the given values.
+
+        :param answer: content of the answer
+        :param prompt_tokens: number of tokens in the prompt
+        :param completion_tokens: number of tokens in the answer
+        :param cached_tokens:
+            number of the prompt tokens which the provider served from its cache
+        """
+        self.answer = answer
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        """Sum the tokens of the prompt and the answer."""
+        return self.prompt_tokens + self.completion_tokens
+
+
+class Usage:
+    """Sum up the tokens reported by the backend over all the requests."""
+
+    def __init__(self) -> None:
+        """Initialize with zero counts."""
+        self.request_count = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, completion: Completion) -> None:
+        """Add the tokens of the ``completion``."""
+        self.request_count += 1
+        self.prompt_tokens += completion.prompt_tokens
+        self.cached_tokens += completion.cached_tokens
+        self.completion_tokens += completion.completion_tokens
+
+    @property
+    def cached_ratio(self) -> float:
+        """
+        Compute the share of the prompt tokens served from the provider's cache.
+
+        >>> usage = Usage()
+        >>> usage.add(Completion("", prompt_tokens=400, completion_tokens=10))
+        >>> usage.add(
+        ...     Completion("", prompt_tokens=400, completion_tokens=10, cached_tokens=300)
+        ... )
+        >>> usage.cached_ratio
+        0.375
+        """
+        if self.prompt_tokens == 0:
+            return 0.0
+
+        return self.cached_tokens / self.prompt_tokens
+
+
+def read_cached_tokens(usage: Mapping[str, Any]) -> int:
+    """
+    Read the number of the cached prompt tokens from the ``usage`` of a completion.
+
+    The models and the API versions which do not cache the prompts do not report
+    the cached tokens at all, so we count them as zero.
+
+    >>> read_cached_tokens(
+    ...     {"prompt_tokens": 1200, "prompt_tokens_details": {"cached_tokens": 1024}}
+    ... )
+    1024
+    >>> read_cached_tokens({"prompt_tokens": 1200})
+    0
+    """
+    details = usage.get("prompt_tokens_details", None)
+    if details is None:
+        return 0
+
+    cached_tokens = details.get("cached_tokens", None)
+    return int(cached_tokens) if cached_tokens is not None else 0
+
+
+class Backend(abc.ABC):
+    """Complete the chat prompts."""
+
+    @abc.abstractmethod
+    async def complete(
+        self,
+        model: str,
+        messages: Sequence[Mapping[str, str]],
+        parameters: Mapping[str, Any],
+    ) -> Completion:
+        """
+        Complete the ``messages`` with the ``model``.
+
+        The ``parameters`` such as ``max_tokens`` or ``temperature`` are passed on
+        to the completion.
+        """
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def stream(
+        self,
+        model: str,
+        messages: Sequence[Mapping[str, str]],
+        parameters: Mapping[str, Any],
+    ) -> AsyncIterator[str]:
+        """
+        Complete the ``messages`` with the ``model`` and stream the answer.
+
+        The ``parameters`` such as ``max_tokens`` or ``temperature`` are passed on
+        to the completion.
+        """
+        raise NotImplementedError()
+
+        # NOTE (mristin):
+        # The yield makes this method an asynchronous generator so that
+        # the implementations can override it as such.
+        yield ""  # pylint: disable=unreachable
+
+
+class OpenAIBackend(Backend):
+    """Complete the prompts with the chat completions of OpenAI."""
+
+    async def complete(
+        self,
+        model: str,
+        messages: Sequence[Mapping[str, str]],
+        parameters: Mapping[str, Any],
+    ) -> Completion:
+        """Complete the ``messages`` with the ``model``."""
+        completion = await openai.ChatCompletion.acreate(  # type: ignore
+            model=model, messages=list(messages), **parameters
+        )
+
+        answer = completion.choices[0].message.content
+        assert isinstance(answer, str)
+
+        return Completion(
+            answer=answer,
+            prompt_tokens=completion.usage.prompt_tokens,
+            completion_tokens=completion.usage.completion_tokens,
+            cached_tokens=read_cached_tokens(completion.usage),
+        )
+
+    async def stream(
+        self,
+        model: str,
+        messages: Sequence[Mapping[str, str]],
+        parameters: Mapping[str, Any],
+    ) -> AsyncIterator[str]:
+        """Complete the ``messages`` with the ``model`` and stream the answer."""
+        response = await openai.ChatCompletion.acreate(  # type: ignore
+            model=model, messages=list(messages), stream=True, **parameters
+        )
+
+        async for chunk in response:
+            content = chunk["choices"][0]["delta"].get("content")
+            if content is not None:
+                assert isinstance(content, str)
+                yield content
+
+
+#: Mark the beginning of the text lines in the prompts
+TEXT_LINES_MARKER = "Here are the text lines:\n"
+
+WORD_RE = re.compile(r"\w+")
+
+
+def join_messages(messages: Sequence[Mapping[str, str]]) -> str:
+    """Join the contents of the ``messages`` back into the whole prompt."""
+    return "".join(message["content"] for message in messages)
+
+
+def synthesize_answer(prompt: str) -> str:
+    """
+    Synthesize a deterministic CSV answer to the ``prompt``.
+
+    Every word of the text lines is picked by about a quarter of the prompts,
+    so that the different parts of speech yield different words.
+
+    >>> print(synthesize_answer(
+    ...     "Write them in a five column CSV.\\n"
+    ...     + TEXT_LINES_MARKER
+    ...     + "Hi, cat\\n"
+    ... ))
+    hi,hi (translated),"Hi, cat","Hi, cat (translated)",adverb
+    cat,cat (translated),"Hi, cat","Hi, cat (translated)",adverb
+    """
+    instructions, _, text = prompt.rpartition(TEXT_LINES_MARKER)
+    combined = "five column CSV" in instructions
+    salt = zlib.crc32(instructions.encode("utf-8"))
+
+    rows = []  # type: List[str]
+    for line in text.splitlines():
+        line = line.strip()
+        if line == "":
+            continue
+
+        escaped_line = line.replace('"', '""')
+
+        observed = set()  # type: Set[str]
+        for match in WORD_RE.finditer(line):
+            word = match.group(0).lower()
+            if word in observed:
+                continue
+
+            observed.add(word)
+
+            word_hash = zlib.crc32(word.encode("utf-8")) ^ salt
+            if not combined and word_hash % 4 != 0:
+                continue
+
+            row = (
+                f'{word},{word} (translated),"{escaped_line}",'
+                f'"{escaped_line} (translated)"'
+            )
+
+            if combined:
+                row += "," + ["verb", "noun", "adjective", "adverb"][word_hash % 4]
+
+            rows.append(row)
+
+    return "\n".join(rows)
+
+
+class FakeBackend(Backend):
+    """Synthesize the answers locally with a simulated latency and error rate."""
+
+    @require(lambda latency: latency >= 0.0)
+    @require(lambda error_rate: 0.0 <= error_rate <= 1.0)
+    def __init__(
+        self, latency: float, error_rate: float, seed: Optional[int] = None
+    ) -> None:
+        """
+        Initialize with the given values.
+
+        :param latency: mean latency of a request in seconds
+        :param error_rate: probability that a request fails with a transient error
+        :param seed: of the random generator for reproducible runs
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+        # NOTE (mristin):
+        # We simulate the prompt caching of the provider by remembering
+        # the system messages which we have already seen.
+        self._seen_system_messages = set()  # type: Set[str]
+
+    async def _simulate_request(self) -> None:
+        """Wait for the simulated latency and fail randomly."""
+        if self.latency > 0.0:
+            await asyncio.sleep(self._random.expovariate(1.0 / self.latency))
+
+        if self._random.random() < self.error_rate:
+            raise openai.error.ServiceUnavailableError(  # type: ignore
+                "The fake backend simulated a transient failure."
+            )
+
+    async def complete(
+        self,
+        model: str,
+        messages: Sequence[Mapping[str, str]],
+        parameters: Mapping[str, Any],
+    ) -> Completion:
+        """Complete the ``messages`` with a synthetic answer, ignoring ``parameters``."""
+        await self._simulate_request()
+
+        answer = synthesize_answer(join_messages(messages))
+
+        cached_tokens = 0
+        if len(messages) > 0 and messages[0]["role"] == "system":
+            system_message = messages[0]["content"]
+            if system_message in self._seen_system_messages:
+                cached_tokens = tokenizing.estimate_token_count(system_message)
+            else:
+                self._seen_system_messages.add(system_message)
+
+        return Completion(
+            answer=answer,
+            prompt_tokens=sum(
+                tokenizing.estimate_token_count(message["content"])
+                for message in messages
+            ),
+            completion_tokens=tokenizing.estimate_token_count(answer),
+            cached_tokens=cached_tokens,
+        )
+
+    async def stream(
+        self,
+        model: str,
+        messages: Sequence[Mapping[str, str]],
+        parameters: Mapping[str, Any],
+    ) -> AsyncIterator[str]:
+        """Complete the ``messages`` with a synthetic answer, ignoring ``parameters``."""
+        await self._simulate_request()
+
+        answer = synthesize_answer(join_messages(messages))
+
+        chunk_size = 16
+        for start in range(0, len(answer), chunk_size):
+            await asyncio.sleep(0)
+            yield answer[start : start + chunk_size]
@@ -0,0 +1,188 @@
+"""Export the prompts as an offline batch job and ingest its results later."""
+
+import json
+import pathlib
+from typing import Any, Dict, Iterable, List, Mapping, Sequence, Tuple
+
+from extractflashcards import journaling
+
+
+def compute_custom_id(key: journaling.UnitKey, prompt_fingerprint: str) -> str:
+    """
+    Compute the stable ID of a unit of work in the batch job.
+
+    The ID includes the beginning of the ``prompt_fingerprint`` so that
+    the answers are never attributed to a different prompt on ingestion, *e.g.*,
+    if the text or the batching changed in the meantime.
+
+    >>> compute_custom_id((3, "noun"), "0123456789abcdef0123")
+    'batch-3-noun-0123456789abcdef'
+    >>> compute_custom_id((3, None), "0123456789abcdef0123")
+    'batch-3-combined-0123456789abcdef'
+    """
+    batch_index, prompt_kind = key
+    kind = prompt_kind if prompt_kind is not None else "combined"
+    return f"batch-{batch_index}-{kind}-{prompt_fingerprint[:16]}"
+
+
+def write_requests(
+    path: pathlib.Path,
+    requests: Iterable[
+        Tuple[
+            journaling.UnitKey,
+            str,
+            str,
+            Mapping[str, Any],
+            Sequence[Mapping[str, str]],
+        ]
+    ],
+) -> int:
+    """
+    Write the requests in the JSONL format of the OpenAI batch endpoint.
+
+    :param path: to the JSONL file
+    :param requests: unit key, prompt fingerprint, model, completion parameters and
+        messages of each request
+    :return: number of the written requests
+
+    The custom IDs of the written requests are matched by the results read back
+    with :py:func:`read_results`:
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     requests_path = pathlib.Path(tmp_dir) / "requests.jsonl"
+    ...     write_requests(
+    ...         requests_path,
+    ...         [
+    ...             ((0, "noun"), "aaaaaaaaaaaaaaaa0", "some-model",
+    ...              {"temperature": 0.0}, [{"role": "user", "content": "Кот спит."}]),
+    ...             ((0, "verb"), "bbbbbbbbbbbbbbbb0", "some-model", {},
+    ...              [{"role": "user", "content": "Кот спит."}]),
+    ...         ],
+    ...     )
+    ...     results_path = pathlib.Path(tmp_dir) / "results.jsonl"
+    ...     with requests_path.open("rt", encoding="utf-8") as fid, \\
+    ...             results_path.open("wt", encoding="utf-8") as out:
+    ...         for line in fid:
+    ...             request = json.loads(line)
+    ...             content = request["body"]["messages"][0]["content"]
+    ...             _ = out.write(json.dumps({
+    ...                 "custom_id": request["custom_id"],
+    ...                 "response": {
+    ...                     "status_code": 200,
+    ...                     "body": {"choices": [{"message": {"content": content}}]},
+    ...                 },
+    ...                 "error": None,
+    ...             }) + "\\n")
+    ...     answers, errors = read_results(results_path)
+    2
+    >>> answers
+    {'batch-0-noun-aaaaaaaaaaaaaaaa': 'Кот спит.', 'batch-0-verb-bbbbbbbbbbbbbbbb': 'Кот спит.'}
+    >>> errors
+    []
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    count = 0
+    with path.open("wt", encoding="utf-8") as fid:
+        for key, prompt_fingerprint, model, parameters, messages in requests:
+            count += 1
+            fid.write(
+                json.dumps(
+                    {
+                        "custom_id": compute_custom_id(key, prompt_fingerprint),
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": {
+                            "model": model,
+                            "messages": list(messages),
+                            **parameters,
+                        },
+                    },
+                    ensure_ascii=False,
+                )
+            )
+            fid.write("\n")
+
+    return count
+
+
+def read_results(path: pathlib.Path) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Read the answers from the JSONL results of the OpenAI batch endpoint.
+
+    The failed requests are skipped and reported as errors.
+
+    :param path: to the JSONL file
+    :return: (answers mapped by the custom IDs, errors if any)
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     path = pathlib.Path(tmp_dir) / "results.jsonl"
+    ...     _ = path.write_text("\\n".join([
+    ...         '{"custom_id": "batch-0-noun", "response": {"status_code": 200, '
+    ...         '"body": {"choices": [{"message": {"content": "дом,house"}}]}}}',
+    ...         '{"custom_id": "batch-0-verb", "error": {"code": "timeout"}}',
+    ...         '{"custom_id": "batch-1-noun", "response": {"status_code": 429}}',
+    ...         '{"custom_id": "batch-1-verb", "response": {"status_code": 200}}',
+    ...         '{"custom_id": "batch-2-noun", "response": {"status_code": 200, '
+    ...         '"body": {"choices": [{"message": {"content": null}}]}}}',
+    ...         '',
+    ...         'not a JSON',
+    ...     ]), encoding="utf-8")
+    ...     answers, errors = read_results(path)
+    >>> answers
+    {'batch-0-noun': 'дом,house'}
+    >>> for error in errors:
+    ...     print(error)
+    Line 2: the request batch-0-verb failed: {'code': 'timeout'}
+    Line 3: the request batch-1-noun failed with the status code 429
+    Line 4: unexpected response to batch-1-verb: 'body'
+    Line 5: the answer to batch-2-noun is not a text
+    Line 7: invalid record: Expecting value: line 1 column 1 (char 0)
+    """
+    answers = dict()  # type: Dict[str, str]
+    errors = []  # type: List[str]
+
+    with path.open("rt", encoding="utf-8") as fid:
+        for i, line in enumerate(fid):
+            if line.strip() == "":
+                continue
+
+            try:
+                record = json.loads(line)
+                custom_id = str(record["custom_id"])
+            except Exception as exception:
+                errors.append(f"Line {i + 1}: invalid record: {exception}")
+                continue
+
+            if record.get("error") is not None:
+                errors.append(
+                    f"Line {i + 1}: the request {custom_id} failed: {record['error']}"
+                )
+                continue
+
+            try:
+                response = record["response"]
+                status_code = int(response["status_code"])
+                if status_code != 200:
+                    errors.append(
+                        f"Line {i + 1}: the request {custom_id} failed "
+                        f"with the status code {status_code}"
+                    )
+                    continue
+
+                content = response["body"]["choices"][0]["message"]["content"]
+            except Exception as exception:
+                errors.append(
+                    f"Line {i + 1}: unexpected response to {custom_id}: {exception}"
+                )
+                continue
+
+            if not isinstance(content, str):
+                errors.append(f"Line {i + 1}: the answer to {custom_id} is not a text")
+                continue
+
+            answers[custom_id] = content
+
+    return answers, errors
@@ -0,0 +1,144 @@
+"""Cache the completions persistently on disk so that re-runs cost nothing."""
+
+import hashlib
+import json
+import pathlib
+import sqlite3
+import time
+from typing import Any, Mapping, Optional
+
+from icontract import require
+
+
+def compute_key(model: str, messages: Any, parameters: Mapping[str, Any]) -> str:
+    """
+    Compute the content-addressed key of a completion request.
+
+    >>> key = compute_key("some-model", [{"role": "user", "content": "hi"}], {})
+    >>> len(key)
+    64
+    """
+    serialized = json.dumps(
+        {"model": model, "messages": messages, "parameters": parameters},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class Cache:
+    """
+    Store the completions in SQLite and evict the least recently used ones.
+
+    The total size of the answers is loaded once and then kept up to date, so that
+    the table is only scanned when some entries need to be evicted.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     cache = Cache(path=pathlib.Path(tmp_dir) / "cache.sqlite", max_size=8)
+    ...     cache.put("a", "1234")
+    ...     cache.put("b", "5678")
+    ...     cache.put("a", "12")
+    ...     cache.put("c", "9012")
+    ...     (cache.total_size, cache.get("a"), cache.get("b"), cache.get("c"))
+    ...     cache.close()
+    (6, '12', None, '9012')
+    """
+
+    @require(lambda max_size: max_size > 0)
+    def __init__(self, path: pathlib.Path, max_size: int) -> None:
+        """
+        Open or create the cache.
+
+        :param path: to the SQLite database
+        :param max_size: maximum total size of the cached answers in bytes
+        """
+        self.path = path
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, "
+            "answer TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "last_access REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS completions_last_access "
+            "ON completions(last_access)"
+        )
+        self._connection.commit()
+
+        (total_size,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM completions"
+        ).fetchone()
+
+        #: Total size of the cached answers in bytes
+        self.total_size = int(total_size)
+
+    def get(self, key: str) -> Optional[str]:
+        """Retrieve the answer for the ``key``, or None if it is not cached."""
+        row = self._connection.execute(
+            "SELECT answer FROM completions WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._connection.execute(
+            "UPDATE completions SET last_access = ? WHERE key = ?", (time.time(), key)
+        )
+        self._connection.commit()
+
+        answer = row[0]
+        assert isinstance(answer, str)
+        return answer
+
+    def put(self, key: str, answer: str) -> None:
+        """Store the ``answer`` for the ``key`` and evict the stale entries."""
+        size = len(answer.encode("utf-8"))
+
+        row = self._connection.execute(
+            "SELECT size FROM completions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self.total_size -= row[0]
+
+        self._connection.execute(
+            "INSERT OR REPLACE INTO completions(key, answer, size, last_access) "
+            "VALUES (?, ?, ?, ?)",
+            (key, answer, size, time.time()),
+        )
+        self.total_size += size
+
+        if self.total_size > self.max_size:
+            self._evict()
+
+        self._connection.commit()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until we fit in the size."""
+        cursor = self._connection.execute(
+            "SELECT key, size FROM completions ORDER BY last_access ASC"
+        )
+        stale_keys = []
+        for key, size in cursor:
+            if self.total_size <= self.max_size:
+                break
+
+            stale_keys.append((key,))
+            self.total_size -= size
+
+        self._connection.executemany(
+            "DELETE FROM completions WHERE key = ?", stale_keys
+        )
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        self._connection.close()
@@ -0,0 +1,128 @@
+"""Read the compressed texts in streaming mode."""
+
+import bz2
+import enum
+import gzip
+import io
+import lzma
+from typing import IO, Optional, TextIO, Tuple, cast
+
+
+class Compression(enum.Enum):
+    """Enumerate the supported compressions of the input texts."""
+
+    GZIP = "gzip"
+    BZ2 = "bz2"
+    XZ = "xz"
+    ZSTD = "zstd"
+
+
+#: Map the compressions to the magic bytes at the start of the compressed data
+MAGIC_BYTES = {
+    Compression.GZIP: b"\x1f\x8b",
+    Compression.BZ2: b"BZh",
+    Compression.XZ: b"\xfd7zXZ\x00",
+    Compression.ZSTD: b"\x28\xb5\x2f\xfd",
+}
+
+#: Map the file extensions to the compressions
+EXTENSIONS = {
+    ".gz": Compression.GZIP,
+    ".gzip": Compression.GZIP,
+    ".bz2": Compression.BZ2,
+    ".xz": Compression.XZ,
+    ".zst": Compression.ZSTD,
+    ".zstd": Compression.ZSTD,
+}
+
+
+def detect_compression(header: bytes) -> Optional[Compression]:
+    """
+    Detect the compression from the magic bytes at the start of the data.
+
+    Return None if the data is not compressed.
+
+    >>> detect_compression(gzip.compress(b"hello"))
+    <Compression.GZIP: 'gzip'>
+    >>> detect_compression(b"hello") is None
+    True
+    """
+    for compression, magic_bytes in MAGIC_BYTES.items():
+        if header.startswith(magic_bytes):
+            return compression
+
+    return None
+
+
+def compression_from_extension(name: str) -> Optional[Compression]:
+    """
+    Infer the compression from the extension of the file ``name``.
+
+    >>> compression_from_extension("corpus.txt.zst")
+    <Compression.ZSTD: 'zstd'>
+    >>> compression_from_extension("corpus.txt") is None
+    True
+    """
+    for extension, compression in EXTENSIONS.items():
+        if name.lower().endswith(extension):
+            return compression
+
+    return None
+
+
+def open_text(
+    raw: io.BufferedReader, name: str
+) -> Tuple[Optional[TextIO], Optional[str]]:
+    """
+    Open the ``raw`` stream as UTF-8 text, decompressing it on the fly if needed.
+
+    The compression is detected from the magic bytes, which we peek at without
+    consuming them so that the STDIN works as well. The extension of the ``name``
+    is only used to report the corrupt or mislabeled files.
+
+    The caller needs to close both the returned text stream and the ``raw``
+    stream, as the decompressors do not close the streams they read from.
+
+    Return the text stream, or an error, if any.
+    """
+    compression = detect_compression(raw.peek(8)[:8])
+
+    if compression is None:
+        expected = compression_from_extension(name)
+        if expected is not None:
+            return None, (
+                f"The extension of {name} suggests {expected.value} compression, "
+                f"but the data does not start with its magic bytes."
+            )
+
+    binary = None  # type: Optional[IO[bytes]]
+
+    if compression is None:
+        binary = raw
+    elif compression is Compression.GZIP:
+        binary = cast(IO[bytes], gzip.GzipFile(fileobj=raw, mode="rb"))
+    elif compression is Compression.BZ2:
+        binary = bz2.BZ2File(raw, mode="rb")
+    elif compression is Compression.XZ:
+        binary = lzma.LZMAFile(raw, mode="rb")
+    elif compression is Compression.ZSTD:
+        try:
+            import zstandard  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            return None, (
+                f"The {name} is compressed with zstd, but the zstandard package "
+                f"is not installed; install extract-flash-cards[zstd]."
+            )
+
+        binary = cast(
+            IO[bytes],
+            zstandard.ZstdDecompressor().stream_reader(
+                raw, read_across_frames=True, closefd=False
+            ),
+        )
+    else:
+        raise AssertionError(f"Unexpected compression: {compression}")
+
+    assert binary is not None
+
+    return io.TextIOWrapper(binary, encoding="utf-8"), None
@@ -6,12 +6,16 @@ import pathlib
 import shutil
 import sys
 import uuid
+from typing import Optional
 
 import anki.collection
 import anki.exporting
 import anki.notes
 import gtts
 
+from extractflashcards import profiling
+from extractflashcards import progress
+
 
 def main(prog: str) -> int:
     """
@@ -37,6 +41,21 @@ def main(prog: str) -> int:
             "If not specified, the audio is not synthesized"
         ),
     )
+    parser.add_argument(
+        "--profile",
+        help=(
+            "If set, report on STDERR how much time was spent in the individual "
+            "stages of the conversion"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile_path",
+        help=(
+            "If set, additionally profile the conversion with cProfile and dump "
+            "the statistics to this file; requires --profile"
+        ),
+    )
 
     args = parser.parse_args()
 
@@ -46,6 +65,10 @@ def main(prog: str) -> int:
     synthesize_audio = (
         str(args.synthesize_audio) if args.synthesize_audio is not None else None
     )
+    profile = bool(args.profile)
+    profile_path = (
+        pathlib.Path(args.profile_path) if args.profile_path is not None else None
+    )
 
     if not csv_path.exists():
         print(f"--csv_path does not exist: {csv_path}", file=sys.stderr)
@@ -55,7 +78,41 @@ def main(prog: str) -> int:
         print(f"--csv_path is not a file: {csv_path}", file=sys.stderr)
         return 1
 
-    with csv_path.open("rt", encoding="utf-8") as fid:
+    if profile_path is not None and not profile:
+        print("--profile_path requires --profile to be specified.", file=sys.stderr)
+        return 1
+
+    profiler = profiling.StageProfiler(cprofile_path=profile_path)
+    profiler.start()
+
+    try:
+        return _convert(
+            csv_path=csv_path,
+            anki_path=anki_path,
+            deck_name=deck_name,
+            synthesize_audio=synthesize_audio,
+            profiler=profiler,
+        )
+    finally:
+        if profile:
+            profiler.stop(sys.stderr)
+
+
+def _convert(
+    csv_path: pathlib.Path,
+    anki_path: pathlib.Path,
+    deck_name: str,
+    synthesize_audio: Optional[str],
+    profiler: profiling.StageProfiler,
+) -> int:
+    """
+    Convert the CSV file to the Anki deck, timing the stages with the ``profiler``.
+
+    :return: exit code
+    """
+    note_count = 0
+
+    with profiler.stage("reading"), csv_path.open("rt", encoding="utf-8") as fid:
         reader = csv.reader(fid)
         for i, row in enumerate(reader):
             if i == 0:
@@ -69,6 +126,8 @@ def main(prog: str) -> int:
                 )
                 continue
 
+            note_count += 1
+
     anki_path.parent.mkdir(exist_ok=True, parents=True)
 
     uid4 = uuid.uuid4()
@@ -76,46 +135,53 @@ def main(prog: str) -> int:
     tmp_dir.mkdir()
 
     try:
-        collection = anki.collection.Collection(str(tmp_dir / "collection.anki2"))
-
-        collection.decks.add_normal_deck_with_name(deck_name)
-        deck_id = collection.decks.id_for_name(deck_name)
-        assert deck_id is not None
-
-        model = collection.models.new(f"{deck_name} model")
-        model["did"] = deck_id
-
-        collection.models.add_field(model, collection.models.new_field("source"))
-
-        if synthesize_audio is not None:
-            collection.models.add_field(model, collection.models.new_field("tts"))
-
-        collection.models.add_field(model, collection.models.new_field("target"))
-        collection.models.add_field(
-            model, collection.models.new_field("example_source")
-        )
-        collection.models.add_field(
-            model, collection.models.new_field("example_target")
+        with profiler.stage("model creation"):
+            collection = anki.collection.Collection(str(tmp_dir / "collection.anki2"))
+
+            collection.decks.add_normal_deck_with_name(deck_name)
+            deck_id = collection.decks.id_for_name(deck_name)
+            assert deck_id is not None
+
+            model = collection.models.new(f"{deck_name} model")
+            model["did"] = deck_id
+
+            collection.models.add_field(model, collection.models.new_field("source"))
+
+            if synthesize_audio is not None:
+                collection.models.add_field(model, collection.models.new_field("tts"))
+
+            collection.models.add_field(model, collection.models.new_field("target"))
+            collection.models.add_field(
+                model, collection.models.new_field("example_source")
+            )
+            collection.models.add_field(
+                model, collection.models.new_field("example_target")
+            )
+
+            tmpl = collection.models.new_template("main-template")
+            if synthesize_audio is not None:
+                tmpl["qfmt"] = "{{source}}\n\n{{tts}}"
+            else:
+                tmpl["qfmt"] = "{{source}}"
+
+            tmpl["afmt"] = (
+                "{{FrontSide}}\n\n"
+                "<hr>\n\n"
+                "<div>{{target}}</div>"
+                "<div>{{example_source}}</div>"
+                "<div>{{example_target}}</div>"
+            )
+            collection.models.addTemplate(model, tmpl)
+
+            collection.models.update(model)
+            collection.models.set_current(model)
+            collection.models.save(model)
+
+        reporter = progress.ProgressReporter(
+            stream=sys.stderr, noun="notes", total=note_count
         )
-
-        tmpl = collection.models.new_template("main-template")
-        if synthesize_audio is not None:
-            tmpl["qfmt"] = "{{source}}\n\n{{tts}}"
-        else:
-            tmpl["qfmt"] = "{{source}}"
-
-        tmpl["afmt"] = (
-            "{{FrontSide}}\n\n"
-            "<hr>\n\n"
-            "<div>{{target}}</div>"
-            "<div>{{example_source}}</div>"
-            "<div>{{example_target}}</div>"
-        )
-        collection.models.addTemplate(model, tmpl)
-
-        collection.models.update(model)
-        collection.models.set_current(model)
-        collection.models.save(model)
+        inserted_count = 0
+        clip_count = 0
 
         with csv_path.open("rt", encoding="utf-8") as fid:
             reader = csv.reader(fid)
@@ -128,25 +194,42 @@ def main(prog: str) -> int:
 
                 source, target, example_source, example_target = row
 
-                note = anki.notes.Note(collection, model)
-                note["source"] = source
-                note["target"] = target
-                note["example_source"] = example_source
-                note["example_target"] = example_target
-                note.guid = f"card{i}"
-
+                sound = None  # type: Optional[str]
                 if synthesize_audio is not None:
-                    tts = gtts.gTTS(text=source, lang=synthesize_audio)
+                    with profiler.stage("TTS"):
+                        tts = gtts.gTTS(text=source, lang=synthesize_audio)
+
+                        mp3_pth = tmp_dir / f"{uid4}-{i}.mp3"
+                        tts.save(str(mp3_pth))
+                        collection.media.add_file(str(mp3_pth))
+                        sound = f"[sound:{mp3_pth.name}]"
 
-                    mp3_pth = tmp_dir / f"{uid4}-{i}.mp3"
-                    tts.save(str(mp3_pth))
-                    collection.media.add_file(str(mp3_pth))
-                    note["tts"] = f"[sound:{mp3_pth.name}]"
+                    clip_count += 1
+
+                with profiler.stage("note insertion"):
+                    note = anki.notes.Note(collection, model)
+                    note["source"] = source
+                    note["target"] = target
+                    note["example_source"] = example_source
+                    note["example_target"] = example_target
+                    note.guid = f"card{i}"
+
+                    if sound is not None:
+                        note["tts"] = sound
+
+                    collection.addNote(note)
+
+                inserted_count += 1
+                if synthesize_audio is not None:
+                    reporter.update(completed=inserted_count, clips=clip_count)
+                else:
+                    reporter.update(completed=inserted_count)
 
-                collection.addNote(note)
+        reporter.close()
 
-        export = anki.exporting.AnkiPackageExporter(collection)
-        export.exportInto(str(anki_path))
+        with profiler.stage("exportInto"):
+            export = anki.exporting.AnkiPackageExporter(collection)
+            export.exportInto(str(anki_path))
     finally:
         if tmp_dir.exists():
             shutil.rmtree(tmp_dir)
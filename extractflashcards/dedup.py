@@ -0,0 +1,278 @@
+"""Deduplicate the extracted words and the input lines in bounded memory."""
+
+import hashlib
+import json
+import math
+import pathlib
+import sqlite3
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from icontract import require
+
+from extractflashcards import vocabulary
+
+
+class BloomFilter:
+    """
+    Test the membership probabilistically in a fixed-size bit array.
+
+    There are no false negatives, but the false positives are possible.
+
+    >>> bloom = BloomFilter(expected_items=100, false_positive_rate=0.01)
+    >>> bloom.add("дом")
+    >>> "дом" in bloom
+    True
+    """
+
+    @require(lambda expected_items: expected_items > 0)
+    @require(lambda false_positive_rate: 0.0 < false_positive_rate < 1.0)
+    def __init__(self, expected_items: int, false_positive_rate: float) -> None:
+        """
+        Size the filter optimally for the given load.
+
+        :param expected_items: number of the items expected to be added
+        :param false_positive_rate: expected rate of the false positives at that load
+        """
+        bit_count = math.ceil(
+            -expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)
+        )
+        self.bit_count = max(8, bit_count)
+        self.hash_count = max(1, round(self.bit_count / expected_items * math.log(2)))
+        self._bits = bytearray((self.bit_count + 7) // 8)
+
+    def _positions(self, item: str) -> List[int]:
+        # NOTE (mristin):
+        # We derive all the hashes from a single digest by double hashing
+        # (Kirsch and Mitzenmacher, 2006).
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+
+        return [(first + i * second) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, item: str) -> None:
+        """Add the ``item`` to the filter."""
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: object) -> bool:
+        """Check whether the ``item`` has been possibly added."""
+        if not isinstance(item, str):
+            return False
+
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class Deduplicator:
+    """
+    Remember the normalized words in a Bloom filter backed by an exact on-disk set.
+
+    Most of the new words are recognized as new by the Bloom filter alone. Only
+    the possible duplicates are confirmed against the on-disk set, so that the
+    memory stays bounded regardless of the size of the corpus.
+
+    >>> deduplicator = Deduplicator()
+    >>> deduplicator.add_if_new("Дом")
+    True
+    >>> deduplicator.add_if_new("дом")
+    False
+    >>> "ДОМ" in deduplicator
+    True
+    """
+
+    @require(lambda expected_words: expected_words > 0)
+    @require(lambda false_positive_rate: 0.0 < false_positive_rate < 1.0)
+    def __init__(
+        self, expected_words: int = 1_000_000, false_positive_rate: float = 0.01
+    ) -> None:
+        """
+        Initialize an empty deduplicator.
+
+        :param expected_words:
+            number of the words expected to be seen; more words only increase
+            the number of the confirmations on disk
+        :param false_positive_rate: of the Bloom filter at the expected load
+        """
+        self._bloom = BloomFilter(
+            expected_items=expected_words, false_positive_rate=false_positive_rate
+        )
+
+        # NOTE (mristin):
+        # The empty file name opens a private temporary database which SQLite
+        # spills to disk and deletes on close.
+        self._connection = sqlite3.connect("", isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode = OFF")
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._connection.execute("CREATE TABLE words (word TEXT PRIMARY KEY)")
+
+    def _contains_normalized(self, normalized: str) -> bool:
+        if normalized not in self._bloom:
+            return False
+
+        row = self._connection.execute(
+            "SELECT 1 FROM words WHERE word = ?", (normalized,)
+        ).fetchone()
+        return row is not None
+
+    def _insert_normalized(self, normalized: str) -> None:
+        self._bloom.add(normalized)
+        self._connection.execute(
+            "INSERT OR IGNORE INTO words(word) VALUES (?)", (normalized,)
+        )
+
+    def __contains__(self, word: object) -> bool:
+        """Check whether the ``word`` has been seen, up to the normalization."""
+        if not isinstance(word, str):
+            return False
+
+        return self._contains_normalized(vocabulary.normalize_word(word))
+
+    def add_if_new(self, word: str) -> bool:
+        """
+        Add the ``word`` if it has not been seen yet.
+
+        Return True if the word is new.
+        """
+        normalized = vocabulary.normalize_word(word)
+        if self._contains_normalized(normalized):
+            return False
+
+        self._insert_normalized(normalized)
+        return True
+
+    def update(self, words: Iterable[str]) -> None:
+        """Add all the ``words``."""
+        for word in words:
+            self._insert_normalized(vocabulary.normalize_word(word))
+
+    def close(self) -> None:
+        """Close and delete the on-disk set."""
+        self._connection.close()
+
+
+class LineOccurrences:
+    """
+    Map every normalized line to the line numbers of all its occurrences.
+
+    The map is kept in a private on-disk SQLite database so that the memory stays
+    bounded regardless of the size of the text. Only the counts are kept in
+    memory.
+
+    >>> occurrences = LineOccurrences()
+    >>> occurrences.add("la la", 1)
+    True
+    >>> occurrences.add("sing", 2)
+    True
+    >>> occurrences.add("la la", 3)
+    False
+    >>> list(occurrences.iterate())
+    [('la la', [1, 3]), ('sing', [2])]
+    >>> occurrences.line_count, occurrences.unique_count, occurrences.repeated_count
+    (3, 2, 1)
+    >>> occurrences.close()
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty map."""
+        #: Number of all the added occurrences
+        self.line_count = 0
+
+        #: Number of the distinct lines
+        self.unique_count = 0
+
+        #: Number of the distinct lines which occur more than once
+        self.repeated_count = 0
+
+        # NOTE (mristin):
+        # See the note in :py:class:`Deduplicator` about the empty file name.
+        self._connection = sqlite3.connect("", isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode = OFF")
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._connection.execute(
+            "CREATE TABLE lines ("
+            "id INTEGER PRIMARY KEY, "
+            "line TEXT NOT NULL UNIQUE, "
+            "count INTEGER NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE occurrences ("
+            "line_id INTEGER NOT NULL, "
+            "line_number INTEGER NOT NULL)"
+        )
+
+    @require(lambda line_number: line_number > 0)
+    def add(self, line: str, line_number: int) -> bool:
+        """
+        Record that the normalized ``line`` occurs at the 1-based ``line_number``.
+
+        Return True if this is the first occurrence of the line.
+        """
+        row = self._connection.execute(
+            "SELECT id, count FROM lines WHERE line = ?", (line,)
+        ).fetchone()  # type: Optional[Tuple[int, int]]
+
+        if row is None:
+            cursor = self._connection.execute(
+                "INSERT INTO lines(line, count) VALUES (?, 1)", (line,)
+            )
+            line_id = cursor.lastrowid
+            self.unique_count += 1
+        else:
+            line_id, count = row
+            self._connection.execute(
+                "UPDATE lines SET count = ? WHERE id = ?", (count + 1, line_id)
+            )
+            if count == 1:
+                self.repeated_count += 1
+
+        self._connection.execute(
+            "INSERT INTO occurrences(line_id, line_number) VALUES (?, ?)",
+            (line_id, line_number),
+        )
+        self.line_count += 1
+
+        return row is None
+
+    def iterate(self) -> Iterator[Tuple[str, List[int]]]:
+        """Iterate over the lines and their line numbers in the order of the text."""
+        cursor = self._connection.execute(
+            "SELECT lines.line, occurrences.line_number "
+            "FROM lines JOIN occurrences ON occurrences.line_id = lines.id "
+            "ORDER BY lines.id, occurrences.line_number"
+        )
+
+        current = None  # type: Optional[str]
+        line_numbers = []  # type: List[int]
+        for line, line_number in cursor:
+            if line != current:
+                if current is not None:
+                    yield current, line_numbers
+
+                current = line
+                line_numbers = []
+
+            line_numbers.append(line_number)
+
+        if current is not None:
+            yield current, line_numbers
+
+    def write(self, path: pathlib.Path) -> None:
+        """Write every line with its line numbers as a JSON object on its own line."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with path.open("wt", encoding="utf-8") as fid:
+            for line, line_numbers in self.iterate():
+                fid.write(
+                    json.dumps(
+                        {"line": line, "line_numbers": line_numbers},
+                        ensure_ascii=False,
+                    )
+                )
+                fid.write("\n")
+
+    def close(self) -> None:
+        """Close and delete the on-disk map."""
+        self._connection.close()
@@ -0,0 +1,86 @@
+"""Seed the store of the known words from the existing CSV files with flash cards."""
+
+import argparse
+import csv
+import pathlib
+import sys
+
+from extractflashcards import vocabulary
+
+
+def main(prog: str) -> int:
+    """
+    Execute the main routine.
+
+    :param prog: name of the program to be displayed in the help
+    :return: exit code
+    """
+    parser = argparse.ArgumentParser(prog=prog, description=__doc__)
+    parser.add_argument(
+        "--known_words_path",
+        help="Path to the SQLite store of the known words",
+        required=True,
+    )
+    parser.add_argument(
+        "--csv_paths",
+        help=(
+            "Paths to the CSV files generated by extract-flash-cards. "
+            "The source language is read from the first column of the header"
+        ),
+        nargs="+",
+        required=True,
+    )
+
+    args = parser.parse_args()
+
+    known_words_path = pathlib.Path(args.known_words_path)
+    csv_paths = [pathlib.Path(csv_path) for csv_path in args.csv_paths]
+
+    for csv_path in csv_paths:
+        if not csv_path.exists():
+            print(f"--csv_paths does not exist: {csv_path}", file=sys.stderr)
+            return 1
+
+        if not csv_path.is_file():
+            print(f"--csv_paths is not a file: {csv_path}", file=sys.stderr)
+            return 1
+
+    known_words_path.parent.mkdir(parents=True, exist_ok=True)
+    known_words = vocabulary.KnownWords(path=known_words_path)
+
+    try:
+        for csv_path in csv_paths:
+            with csv_path.open("rt", encoding="utf-8") as fid:
+                reader = csv.reader(fid)
+
+                header = next(reader, None)
+                if header is None or len(header) == 0:
+                    print(
+                        f"The --csv_paths {csv_path} has no header, skipping it",
+                        file=sys.stderr,
+                    )
+                    continue
+
+                language = header[0]
+
+                added = known_words.add(
+                    language=language, words=(row[0] for row in reader if len(row) > 0)
+                )
+
+            print(
+                f"Imported {added} new {language} word(s) from {csv_path}",
+                file=sys.stderr,
+            )
+    finally:
+        known_words.close()
+
+    return 0
+
+
+def entry_point() -> int:
+    """Provide an entry point for a console script."""
+    return main(prog="import-known-words")
+
+
+if __name__ == "__main__":
+    sys.exit(main(prog="import-known-words"))
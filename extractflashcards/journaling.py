@@ -0,0 +1,158 @@
+"""Journal the completed units of work so that an interrupted run can resume."""
+
+import hashlib
+import json
+import os
+import pathlib
+from typing import Dict, Iterable, List, Optional, Sequence, Set, TextIO, Tuple
+
+#: Identify a unit of work by its batch index and its prompt kind
+UnitKey = Tuple[int, Optional[str]]
+
+
+def compute_fingerprint(prompts: Iterable[str]) -> str:
+    """
+    Fingerprint the ``prompts`` so that we do not resume a different run.
+
+    >>> compute_fingerprint(["a", "b"]) == compute_fingerprint(["a", "b"])
+    True
+    >>> compute_fingerprint(["a", "b"]) == compute_fingerprint(["ab"])
+    False
+    """
+    hsh = hashlib.sha256()
+    for prompt in prompts:
+        encoded = prompt.encode("utf-8")
+        hsh.update(len(encoded).to_bytes(8, "little"))
+        hsh.update(encoded)
+
+    return hsh.hexdigest()
+
+
+class State:
+    """Represent the progress recorded in a journal."""
+
+    def __init__(
+        self, fingerprint: str, completed: Dict[UnitKey, str], observed: Set[str]
+    ) -> None:
+        """
+        Initialize with the given values.
+
+        :param fingerprint: of the instructions of the run which has been journaled
+        :param completed:
+            keys of the units whose answers have been written, mapped to
+            the fingerprints of their prompts
+        :param observed: words which have been written to the output
+        """
+        self.fingerprint = fingerprint
+        self.completed = completed
+        self.observed = observed
+
+
+def load(path: pathlib.Path) -> Tuple[Optional[State], Optional[str]]:
+    """
+    Load the state from the journal at ``path``.
+
+    A truncated last record, *e.g.*, due to a crash in the middle of writing,
+    is ignored.
+
+    Return the state, or an error, if any.
+    """
+    with path.open("rt", encoding="utf-8") as fid:
+        lines = fid.read().splitlines()
+
+    if len(lines) == 0:
+        return None, f"The journal {path} is empty."
+
+    try:
+        header = json.loads(lines[0])
+        fingerprint = header["fingerprint"]
+    except Exception as exception:
+        return None, f"The header of the journal {path} is invalid: {exception}"
+
+    if not isinstance(fingerprint, str):
+        return None, f"The fingerprint in the journal {path} is not a string."
+
+    state = State(fingerprint=fingerprint, completed=dict(), observed=set())
+
+    for i, line in enumerate(lines[1:]):
+        try:
+            record = json.loads(line)
+            batch_index = int(record["batch_index"])
+            prompt_kind = record["prompt_kind"]
+            prompt_fingerprint = str(record["prompt_fingerprint"])
+            words = [str(word) for word in record["words"]]
+        except Exception as exception:
+            if i == len(lines) - 2:
+                break
+
+            return None, f"The record on line {i + 2} of {path} is invalid: {exception}"
+
+        state.completed[
+            (batch_index, str(prompt_kind) if prompt_kind is not None else None)
+        ] = prompt_fingerprint
+        state.observed.update(words)
+
+    return state, None
+
+
+class Journal:
+    """Append the completed units durably to the journal."""
+
+    def __init__(self, path: pathlib.Path, fingerprint: str, append: bool) -> None:
+        """
+        Open the journal for writing.
+
+        :param path: to the journal
+        :param fingerprint: of the instructions of the current run
+        :param append:
+            if set, append to the existing journal, otherwise start it anew
+        """
+        self.path = path
+
+        # pylint: disable=consider-using-with
+        self._fid = path.open(
+            "at" if append else "wt", encoding="utf-8"
+        )  # type: TextIO
+        # pylint: enable=consider-using-with
+
+        if not append:
+            self._write_line(json.dumps({"fingerprint": fingerprint}))
+
+    def _write_line(self, line: str) -> None:
+        self._write_lines([line])
+
+    def _write_lines(self, lines: Sequence[str]) -> None:
+        for line in lines:
+            self._fid.write(line)
+            self._fid.write("\n")
+
+        self._fid.flush()
+        os.fsync(self._fid.fileno())
+
+    def record_all(self, records: Sequence[Tuple[UnitKey, str, Sequence[str]]]) -> None:
+        """
+        Record the units given as key, prompt fingerprint and the added words.
+
+        The prompt fingerprints allow us to check on resume that the units still
+        have the same prompts. The records are synced to the disk together, which
+        is much cheaper than syncing them one by one.
+        """
+        lines = []  # type: List[str]
+        for (batch_index, prompt_kind), prompt_fingerprint, words in records:
+            lines.append(
+                json.dumps(
+                    {
+                        "batch_index": batch_index,
+                        "prompt_kind": prompt_kind,
+                        "prompt_fingerprint": prompt_fingerprint,
+                        "words": list(words),
+                    },
+                    ensure_ascii=False,
+                )
+            )
+
+        self._write_lines(lines)
+
+    def close(self) -> None:
+        """Close the underlying file."""
+        self._fid.close()
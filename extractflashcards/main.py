@@ -6,16 +6,111 @@ considered a phrase or a sentence in itself.
 """
 
 import argparse
+import asyncio
 import contextlib
-import csv
+import enum
+import functools
 import io
+import itertools
+import os
 import pathlib
 import sys
-from typing import List, Tuple, Optional, Set, TextIO
+import time
+import unicodedata
+from typing import (
+    Any,
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Tuple,
+    Optional,
+    Set,
+)
 
 import openai
 from icontract import require, ensure
 
+from extractflashcards import backends
+from extractflashcards import batch_jobs
+from extractflashcards import caching
+from extractflashcards import compression
+from extractflashcards import dedup
+from extractflashcards import journaling
+from extractflashcards import metrics
+from extractflashcards import profiling
+from extractflashcards import progress
+from extractflashcards import rate_limiting
+from extractflashcards import retrying
+from extractflashcards import routing
+from extractflashcards import sinks
+from extractflashcards import streaming
+from extractflashcards import tokenizing
+from extractflashcards import validation
+from extractflashcards import vocabulary
+from extractflashcards import writing
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Split the ``chunks`` into lines exactly as :py:meth:`str.splitlines` would.
+
+    The ``chunks`` are expected to end at the line breaks, as it is the case when
+    we iterate over a text file or read lines from STDIN.
+
+    >>> list(iter_lines(["hello\\x0cworld\\n", "early\\n", "morning"]))
+    ['hello\\x0c', 'world\\n', 'early\\n', 'morning']
+    """
+    for chunk in chunks:
+        yield from chunk.splitlines(keepends=True)
+
+
+@require(lambda max_batch_length: max_batch_length > 0)
+def iter_batches(
+    lines: Iterable[Tuple[int, str]], max_batch_length: int
+) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+    """
+    Lazily group the ``lines`` into batches as soon as they fill up.
+
+    The ``lines`` are given with their 1-based line numbers in the input text so
+    that the errors refer to them even if some lines have been filtered out.
+
+    Yield batches, or an error as the last item, if any.
+
+    >>> list(iter_batches(
+    ...     enumerate(iter_lines(['hello\\nworld\\nearly\\nin the\\nmorning']), start=1),
+    ...     12
+    ... ))
+    [('hello\\nworld\\n', None), ('early\\n', None), ('in the\\n', None), ('morning', None)]
+
+    >>> list(iter_batches([(1, 'hi\\n'), (7, 'world')], 3))
+    [(None, 'The line 7 is too long (got 5, max. is 3).')]
+    """
+    batch_parts = []  # type: List[str]
+    current_len = 0
+
+    for line_number, line in lines:
+        if len(line) > max_batch_length:
+            yield None, (
+                f"The line {line_number} is too long "
+                f"(got {len(line)}, max. is {max_batch_length})."
+            )
+            return
+
+        if current_len + len(line) > max_batch_length:
+            yield "".join(batch_parts), None
+            batch_parts = []
+            current_len = 0
+
+        batch_parts.append(line)
+        current_len += len(line)
+
+    if len(batch_parts) > 0:
+        yield "".join(batch_parts), None
+
 
 # fmt: off
 @require(lambda max_batch_length: max_batch_length > 0)
@@ -47,158 +142,177 @@ def split_text_into_batches(
     """
     result = []  # type: List[str]
 
-    batch_parts = []  # type: List[str]
-    current_len = 0
+    for batch, error in iter_batches(
+        lines=enumerate(text.splitlines(keepends=True), start=1),
+        max_batch_length=max_batch_length,
+    ):
+        if error is not None:
+            return None, error
 
-    for i, line in enumerate(text.splitlines(keepends=True)):
-        if len(line) > max_batch_length:
-            return None, (
-                f"The line {i + 1} is too long "
-                f"(got {len(line)}, max. is {max_batch_length})."
-            )
+        assert batch is not None
+        result.append(batch)
 
-        if current_len + len(line) > max_batch_length:
-            result.append("".join(batch_parts))
-            batch_parts = []
-            current_len = 0
+    return result, None
 
-        batch_parts.append(line)
-        current_len += len(line)
 
-    if len(batch_parts) > 0:
-        result.append("".join(batch_parts))
+@require(lambda max_batch_tokens: max_batch_tokens > 0)
+def iter_token_batches(
+    lines: Iterable[Tuple[int, str]],
+    max_batch_tokens: int,
+    count_tokens: tokenizing.TokenCounter,
+) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+    """
+    Lazily group the ``lines`` into batches of at most ``max_batch_tokens`` tokens.
 
-    return result, None
+    The ``lines`` are given with their 1-based line numbers in the input text. The
+    tokens of a batch are approximated as the sum of the tokens of its lines.
 
+    Yield batches, or an error as the last item, if any.
 
-def main(prog: str) -> int:
-    """
-    Execute the main routine.
+    >>> list(iter_token_batches(
+    ...     enumerate(iter_lines(['hello\\nworld\\nearly\\nin the\\nmorning']), start=1),
+    ...     12,
+    ...     len
+    ... ))
+    [('hello\\nworld\\n', None), ('early\\n', None), ('in the\\n', None), ('morning', None)]
 
-    :param prog: name of the program to be displayed in the help
-    :return: exit code
+    >>> list(iter_token_batches([(1, 'hi\\n'), (6, 'world')], 4, len))
+    [(None, 'The line 6 is too long (got 5 tokens, max. is 4).')]
     """
-    parser = argparse.ArgumentParser(prog=prog, description=__doc__)
-    parser.add_argument(
-        "--source_language", help="source language of the text", default="Russian"
-    )
-    parser.add_argument(
-        "--target_language",
-        help="target language which we already master",
-        default="English",
-    )
-    parser.add_argument(
-        "--text",
-        help="Text that we want to extract the flash cards from",
-    )
-    parser.add_argument(
-        "--text_path",
-        help=(
-            "Path to the text file that we want to extract the flash cards from. "
-            "Either --text or --text_path needs to be specified, but not both."
-        ),
-    )
-    parser.add_argument(
-        "--openai_key_path",
-        help="Path to the text file containing the OpenAI key",
-        default="openai-key.txt",
-    )
-    parser.add_argument(
-        "--output_path",
-        help="Path where to store the CSV. If not specified, output to STDOUT",
-    )
-
-    args = parser.parse_args()
+    batch_parts = []  # type: List[str]
+    current_tokens = 0
+
+    for line_number, line in lines:
+        line_tokens = count_tokens(line)
+        if line_tokens > max_batch_tokens:
+            yield None, (
+                f"The line {line_number} is too long "
+                f"(got {line_tokens} tokens, max. is {max_batch_tokens})."
+            )
+            return
 
-    source_language = str(args.source_language)
-    target_language = str(args.target_language)
-    text = args.text if args.text is not None else None
-    text_path = pathlib.Path(args.text_path) if args.text_path is not None else None
-    openai_key_path = pathlib.Path(args.openai_key_path)
-    output_path = (
-        pathlib.Path(args.output_path) if args.output_path is not None else None
-    )
+        if current_tokens + line_tokens > max_batch_tokens:
+            yield "".join(batch_parts), None
+            batch_parts = []
+            current_tokens = 0
 
-    if text is not None and text_path is not None:
-        print(
-            "Both --text and --text_path has been specified. You must specify only "
-            "either one of them.",
-            file=sys.stderr,
-        )
-        return 1
+        batch_parts.append(line)
+        current_tokens += line_tokens
 
-    if text is None and text_path is None:
-        print("Neither --text nor --text_path has been specified.", file=sys.stderr)
-        return 1
+    if len(batch_parts) > 0:
+        yield "".join(batch_parts), None
 
-    if text_path is not None:
-        text_source = f"--text_path {text_path}"
-        text = text_path.read_text(encoding="utf-8")
-    else:
-        text_source = "--text"
 
-    assert text is not None
+def normalize_line(line: str) -> str:
+    """
+    Normalize the ``line`` so that the trivially different repetitions coincide.
 
-    if not openai_key_path.exists():
-        print(f"--openai_key_path does not exist: {openai_key_path}", file=sys.stderr)
-        return 1
+    >>> normalize_line("  Hello,\\t world! \\n")
+    'Hello, world!'
+    """
+    return " ".join(unicodedata.normalize("NFC", line).split())
 
-    if not openai_key_path.is_file():
-        print(f"--openai_key_path is not a file: {openai_key_path}", file=sys.stderr)
-        return 1
 
-    try:
-        openai_key = openai_key_path.read_text(encoding="utf-8").strip()
-    except Exception as exception:
-        print(f"Failed to read {openai_key_path}: {exception}", file=sys.stderr)
-        return 1
+def deduplicate_lines(
+    lines: Iterable[Tuple[int, str]], occurrences: dedup.LineOccurrences
+) -> Iterator[Tuple[int, str]]:
+    """
+    Lazily keep only the first occurrence of every line in the ``lines``.
+
+    The empty lines are removed as well.
+
+    :param lines: to be deduplicated, given with their 1-based line numbers
+    :param occurrences:
+        filled with the line numbers of all the occurrences of every
+        normalized line as the ``lines`` are consumed
+    :return: deduplicated lines with their line numbers
+
+    >>> occurrences = dedup.LineOccurrences()
+    >>> list(deduplicate_lines(
+    ...     enumerate(["la la\\n", "la  la\\n", "\\n", "sing\\n", "la la"], start=1),
+    ...     occurrences
+    ... ))
+    [(1, 'la la\\n'), (4, 'sing\\n')]
+    >>> list(occurrences.iterate())
+    [('la la', [1, 2, 5]), ('sing', [4])]
+    """
+    for line_number, line in lines:
+        normalized = normalize_line(line)
+        if normalized == "":
+            continue
 
-    openai.api_key = openai_key
-    model = "gpt-4-turbo-preview"
+        if occurrences.add(normalized, line_number):
+            yield line_number, (line if line.endswith("\n") else line + "\n")
 
-    batches, error = split_text_into_batches(text=text, max_batch_length=500)
-    if error is not None:
-        print(
-            f"{text_source} could not be split into batches "
-            f"for ChatGPT prompts: {error}",
-            file=sys.stderr,
-        )
-        return 1
 
-    assert batches is not None
+def remove_known_lines(
+    lines: Iterable[Tuple[int, str]], known: Container[str], removed: List[int]
+) -> Iterator[Tuple[int, str]]:
+    """
+    Lazily remove the lines whose every word is ``known``.
+
+    :param lines: to be filtered, given with their 1-based line numbers
+    :param known: normalized known words
+    :param removed:
+        filled with the line numbers of the removed lines as the ``lines``
+        are consumed
+    :return: filtered lines with their line numbers
+
+    >>> removed = []
+    >>> list(remove_known_lines(
+    ...     enumerate(["Дом, дом!\\n", "Мой дом.\\n"], start=1), {"дом"}, removed
+    ... ))
+    [(2, 'Мой дом.\\n')]
+    >>> removed
+    [1]
+
+    The line numbers refer to the input text even if the lines are deduplicated
+    afterwards:
+
+    >>> occurrences = dedup.LineOccurrences()
+    >>> list(deduplicate_lines(
+    ...     remove_known_lines(
+    ...         enumerate(["дом\\n", "кот спит\\n", "кот спит\\n"], start=1),
+    ...         {"дом"},
+    ...         []
+    ...     ),
+    ...     occurrences
+    ... ))
+    [(2, 'кот спит\\n')]
+    >>> list(occurrences.iterate())
+    [('кот спит', [2, 3])]
+    """
+    for line_number, line in lines:
+        if vocabulary.is_known_line(line=line, known=known):
+            removed.append(line_number)
+            continue
 
-    with contextlib.ExitStack() as exit_stack:
-        fid = None  # type: Optional[TextIO]
+        yield line_number, line
 
-        if output_path is None:
-            writer = csv.writer(sys.stdout)
-        else:
-            output_path.parent.mkdir(parents=True, exist_ok=True)
 
-            fid = output_path.open(  # pylint: disable=consider-using-with
-                "wt", encoding="utf-8"
-            )
-            exit_stack.push(fid)
+class PartOfSpeech(enum.Enum):
+    """Enumerate the parts of speech which we extract with a separate prompt each."""
 
-            writer = csv.writer(fid)
+    VERB = "verb"
+    NOUN = "noun"
+    ADJECTIVE = "adjective"
+    ADVERB = "adverb"
 
-        writer.writerow(
-            [
-                source_language,
-                target_language,
-                f"Phrase in {source_language}",
-                f"Phrase in {target_language}",
-            ]
-        )
-        if fid is not None:
-            fid.flush()
 
-        observed_set = set()  # type: Set[str]
+def generate_instructions(
+    part_of_speech: PartOfSpeech,
+    source_language: str,
+    target_language: str,
+) -> str:
+    """
+    Generate the instructions to extract the words of ``part_of_speech``.
 
-        for batch in batches:
-            for prompt in [
-                (
-                    f"""\
+    The instructions end with :py:data:`backends.TEXT_LINES_MARKER` so that
+    the text lines can directly follow them.
+    """
+    # pylint: disable=line-too-long
+    if part_of_speech is PartOfSpeech.VERB:
+        return f"""\
 Please extract from the following text lines in {source_language} all the verbs.
 Write them in a four column CSV:
 one column for the {source_language} verbs in infinitive present tense,
@@ -216,10 +330,9 @@ Do not output the CSV header!
 Output only valid CSV, no text before or after!
 
 Here are the text lines:
-{batch}"""
-                ),
-                (
-                    f"""\
+"""
+    elif part_of_speech is PartOfSpeech.NOUN:
+        return f"""\
 Please extract from the following text lines in {source_language} all the nouns.
 Write them in a four column CSV:
 one column for the {source_language} noun in nominative singular (not plural!),
@@ -238,11 +351,9 @@ Do not output the CSV header!
 Output only valid CSV, no text before or after!
 
 Here are the text lines:
-{batch}"""
-                ),
-                # pylint: disable=line-too-long
-                (
-                    f"""\
+"""
+    elif part_of_speech is PartOfSpeech.ADJECTIVE:
+        return f"""\
 Please extract from the following text lines in {source_language} all the adjectives in {source_language}.
 Do not output any adverbs, only adjectives!
 
@@ -267,10 +378,9 @@ Do not output the CSV header!
 Output only valid CSV, no text before or after!
 
 Here are the text lines:
-{batch}"""
-                ),
-                (
-                    f"""\
+"""
+    elif part_of_speech is PartOfSpeech.ADVERB:
+        return f"""\
 Please extract from the following text lines in {source_language} all the adverbs in {source_language}.
 Write them in a four column CSV:
 one column for the {source_language} adverb,
@@ -289,35 +399,2032 @@ Do not output the CSV header!
 Output only valid CSV, no text before or after!
 
 Here are the text lines:
-{batch}"""
-                ),
-                # pylint: enable=line-too-long
-            ]:
-                try:
-                    completion = openai.ChatCompletion.create(  # type: ignore
-                        model=model, messages=[{"role": "user", "content": prompt}]
+"""
+    # pylint: enable=line-too-long
+
+    raise AssertionError(f"Unexpected part of speech: {part_of_speech}")
+
+
+def generate_combined_instructions(
+    source_language: str,
+    target_language: str,
+) -> str:
+    """
+    Generate the instructions to extract all the parts of speech at once.
+
+    The instructions end with :py:data:`backends.TEXT_LINES_MARKER` so that
+    the text lines can directly follow them.
+    """
+    part_of_speech_literals = ", ".join(
+        part_of_speech.value for part_of_speech in PartOfSpeech
+    )
+
+    # pylint: disable=line-too-long
+    return f"""\
+Please extract from the following text lines in {source_language} all the verbs, nouns, adjectives and adverbs.
+Write them in a five column CSV:
+one column for the {source_language} word,
+one column for the translation in {target_language},
+one column with the line content where the word appears in,
+one column with the translation of the line in {target_language},
+and one column with the part of speech, which must be one of: {part_of_speech_literals}.
+
+Give the verbs in infinitive present tense.
+Give the nouns in nominative singular (not plural!).
+Transform the adjectives to nominative singular masculine (masculine! nominative! not plural)!
+Adjective, not adverb!
+
+Do not forget to escape the commas with double-quotes as the output is a CSV.
+
+Make sure that the word really appears in the line in the third column!
+
+Do not output the CSV header!
+
+Output only valid CSV, no text before or after!
+
+Here are the text lines:
+"""
+    # pylint: enable=line-too-long
+
+
+@functools.lru_cache(maxsize=None)
+def assemble_instructions(
+    part_of_speech: Optional[PartOfSpeech], source_language: str, target_language: str
+) -> str:
+    """
+    Assemble the instructions shared by all the prompts of a language pair.
+
+    The instructions are sent as the system message and the batch as the user
+    message. As the system message is byte-identical for all the batches of
+    the same ``part_of_speech`` (or of the combined prompts, if None), the provider
+    can cache it as the prompt prefix.
+
+    >>> instructions = assemble_instructions(None, "Russian", "English")
+    >>> instructions.endswith(backends.TEXT_LINES_MARKER)
+    True
+    >>> instructions is assemble_instructions(None, "Russian", "English")
+    True
+    """
+    if part_of_speech is None:
+        instructions = generate_combined_instructions(
+            source_language=source_language, target_language=target_language
+        )
+    else:
+        instructions = generate_instructions(
+            part_of_speech=part_of_speech,
+            source_language=source_language,
+            target_language=target_language,
+        )
+
+    assert instructions.endswith(backends.TEXT_LINES_MARKER)
+    return instructions
+
+
+class PromptMode(enum.Enum):
+    """Enumerate how the parts of speech are distributed over the prompts."""
+
+    #: One prompt per part of speech and batch
+    SEPARATE = "separate"
+
+    #: One prompt per batch covering all the parts of speech
+    COMBINED = "combined"
+
+
+class Unit:
+    """Represent a unit of work, *i.e.*, a single prompt for a single batch."""
+
+    @require(lambda batch_index: batch_index >= 0)
+    def __init__(
+        self,
+        batch_index: int,
+        part_of_speech: Optional[PartOfSpeech],
+        source_language: str,
+        target_language: str,
+        batch: str,
+    ) -> None:
+        """
+        Initialize with the given values and assemble the instructions.
+
+        :param batch_index: index of the batch in the text
+        :param part_of_speech:
+            part of speech that we extract from the batch, or None if we extract
+            all of them with a combined prompt
+        :param source_language: of the text
+        :param target_language: of the translations
+        :param batch: text lines to extract the words from
+        """
+        self.batch_index = batch_index
+        self.part_of_speech = part_of_speech
+        self.source_language = source_language
+        self.target_language = target_language
+        self.batch = batch
+
+        self.instructions = assemble_instructions(
+            part_of_speech=part_of_speech,
+            source_language=source_language,
+            target_language=target_language,
+        )
+
+    @property
+    def prompt(self) -> str:
+        """Concatenate the instructions and the batch into the whole prompt."""
+        return self.instructions + self.batch
+
+    def with_batch(self, batch: str) -> "Unit":
+        """Make a unit with the same key and the same instructions for ``batch``."""
+        return Unit(
+            batch_index=self.batch_index,
+            part_of_speech=self.part_of_speech,
+            source_language=self.source_language,
+            target_language=self.target_language,
+            batch=batch,
+        )
+
+    def __str__(self) -> str:
+        """Describe the unit for the messages to the user."""
+        if self.part_of_speech is None:
+            return f"the combined prompt for the batch {self.batch_index + 1}"
+
+        return (
+            f"the prompt for {self.part_of_speech.value}s "
+            f"in the batch {self.batch_index + 1}"
+        )
+
+    @property
+    def key(self) -> journaling.UnitKey:
+        """Identify the unit in the journal."""
+        return (
+            self.batch_index,
+            self.part_of_speech.value if self.part_of_speech is not None else None,
+        )
+
+
+def compose_messages(unit: Unit) -> List[Dict[str, str]]:
+    """
+    Compose the chat messages to be sent for the ``unit``.
+
+    The shared instructions come first as the system message so that they
+    form a cacheable prefix, while the user message holds only the batch.
+    """
+    return [
+        {"role": "system", "content": unit.instructions},
+        {"role": "user", "content": unit.batch},
+    ]
+
+
+async def _request(
+    unit: Unit,
+    backend: backends.Backend,
+    route: routing.Route,
+    semaphore: asyncio.Semaphore,
+    rate_limiter: rate_limiting.RateLimiter,
+    count_tokens: tokenizing.TokenCounter,
+    cache: Optional[caching.Cache],
+    stream: bool,
+    retry_policy: retrying.RetryPolicy,
+    on_rows: Callable[[List[List[str]]], None],
+    usage: backends.Usage,
+    request_metrics: Optional[metrics.RequestMetrics],
+) -> None:
+    """
+    Send the prompt of the ``unit`` to ChatGPT and pass the raw rows to ``on_rows``.
+
+    The prompt is sent to the model of the ``route`` with its parameters. If the model
+    still fails after the retries, the prompt is sent to the fallback model of
+    the ``route``, if any.
+
+    If the answer is available in the ``cache``, no request is sent. If ``stream``
+    is set, the rows are passed on as soon as they are received, and the rows whose
+    words have been passed on by a failed attempt are skipped. The transient
+    failures are retried according to the ``retry_policy``. The tokens of
+    the request are summed up in the ``usage``, and measured in
+    the ``request_metrics``, if given.
+    """
+    messages = compose_messages(unit)
+    parameters = route.parameters
+
+    if cache is not None:
+        for model in route.models:
+            cached_answer = cache.get(
+                caching.compute_key(
+                    model=model, messages=messages, parameters=parameters
+                )
+            )
+            if cached_answer is not None:
+                if request_metrics is not None:
+                    request_metrics.cached_answer = True
+                    request_metrics.model = model
+
+                on_rows(_parse_answer(cached_answer, request_metrics))
+                return
+
+    estimated_tokens = count_tokens(unit.prompt)
+
+    # NOTE (mristin):
+    # The rows streamed by a failed attempt have already been passed on. We skip
+    # their words in the following attempts so that the retries and the fallback
+    # model do not pass them on once more.
+    streamed_words = set()  # type: Set[str]
+
+    async def attempt(model: str) -> backends.Completion:
+        """Send a single request and return its completion."""
+        queued = time.perf_counter()
+
+        attempt_words = set()  # type: Set[str]
+
+        def pass_new_rows(rows: List[List[str]]) -> None:
+            """Pass on the ``rows`` whose words no previous attempt passed on."""
+            new_rows = [
+                row
+                for row in rows
+                if vocabulary.normalize_word(row[0]) not in streamed_words
+            ]
+            attempt_words.update(vocabulary.normalize_word(row[0]) for row in new_rows)
+
+            if len(new_rows) > 0:
+                on_rows(new_rows)
+
+        async with semaphore:
+            await rate_limiter.acquire(estimated_tokens)
+
+            sent = time.perf_counter()
+            if request_metrics is not None:
+                request_metrics.attempts += 1
+                request_metrics.queue_wait += sent - queued
+
+            try:
+                if stream:
+                    answer = await asyncio.wait_for(
+                        _receive_stream(
+                            backend=backend,
+                            model=model,
+                            messages=messages,
+                            parameters=parameters,
+                            on_rows=pass_new_rows,
+                            request_metrics=request_metrics,
+                        ),
+                        timeout=retry_policy.timeout,
                     )
-                except openai.error.AuthenticationError as exception:
-                    print(
-                        f"Failed to authenticate with OpenAI: {exception}",
-                        file=sys.stderr,
+
+                    # NOTE (mristin):
+                    # The streamed responses do not report the usage, so we count
+                    # ourselves. We can not tell the cached tokens in that case.
+                    return backends.Completion(
+                        answer=answer,
+                        prompt_tokens=estimated_tokens,
+                        completion_tokens=count_tokens(answer),
                     )
-                    return 1
 
-                answer = completion.choices[0].message.content
-                reader = csv.reader(io.StringIO(answer))
-                for row in reader:
-                    word = row[0]
+                return await asyncio.wait_for(
+                    backend.complete(
+                        model=model, messages=messages, parameters=parameters
+                    ),
+                    timeout=retry_policy.timeout,
+                )
+            finally:
+                streamed_words.update(attempt_words)
 
-                    if word in observed_set:
-                        continue
+                if request_metrics is not None:
+                    request_metrics.latency += time.perf_counter() - sent
+
+    def report_retry(failed_attempt: int, backoff: float, error: BaseException) -> None:
+        print(
+            f"The attempt {failed_attempt + 1} for {unit} failed, "
+            f"retrying in {backoff:.1f} seconds: {type(error).__name__} {error}",
+            file=sys.stderr,
+        )
+
+    completion = None  # type: Optional[backends.Completion]
+    model = route.model
+
+    for i, model in enumerate(route.models):
+        try:
+            completion = await retrying.retry(
+                call=functools.partial(attempt, model),
+                policy=retry_policy,
+                on_retry=report_retry,
+            )
+            break
+        except openai.error.AuthenticationError:
+            raise
+        except (openai.error.OpenAIError, asyncio.TimeoutError) as exception:
+            if i == len(route.models) - 1:
+                raise
+
+            print(
+                f"The model {model} failed for {unit}, falling back to "
+                f"{route.models[i + 1]}: {type(exception).__name__} {exception}",
+                file=sys.stderr,
+            )
+
+    assert completion is not None
+
+    rate_limiter.correct(
+        estimated_tokens=estimated_tokens,
+        actual_tokens=completion.total_tokens,
+    )
+    usage.add(completion)
+
+    if request_metrics is not None:
+        request_metrics.model = model
+        request_metrics.prompt_tokens = completion.prompt_tokens
+        request_metrics.cached_tokens = completion.cached_tokens
+        request_metrics.completion_tokens = completion.completion_tokens
+
+    answer = completion.answer
+
+    if not stream:
+        on_rows(_parse_answer(answer, request_metrics))
+
+    if cache is not None:
+        cache.put(
+            caching.compute_key(model=model, messages=messages, parameters=parameters),
+            answer,
+        )
+
+
+def _parse_answer(
+    answer: str, request_metrics: Optional[metrics.RequestMetrics]
+) -> List[List[str]]:
+    """Parse the ``answer`` into rows and measure the parse time, if requested."""
+    start = time.perf_counter()
+    rows = validation.parse_lines(answer)
+
+    if request_metrics is not None:
+        request_metrics.parse_time += time.perf_counter() - start
+
+    return rows
+
+
+def make_validator(unit: Unit) -> validation.AnswerValidator:
+    """Make the validator of the answers to the ``unit``."""
+    return validation.AnswerValidator(
+        batch=unit.batch,
+        with_part_of_speech=unit.part_of_speech is None,
+        parts_of_speech=[part_of_speech.value for part_of_speech in PartOfSpeech],
+    )
+
+
+async def _complete(
+    unit: Unit,
+    backend: backends.Backend,
+    route: routing.Route,
+    semaphore: asyncio.Semaphore,
+    rate_limiter: rate_limiting.RateLimiter,
+    count_tokens: tokenizing.TokenCounter,
+    cache: Optional[caching.Cache],
+    stream: bool,
+    retry_policy: retrying.RetryPolicy,
+    on_rows: Callable[[Unit, List[List[str]]], int],
+    statistics: validation.Statistics,
+    usage: backends.Usage,
+    recorder: Optional[metrics.Recorder],
+) -> None:
+    """
+    Complete the ``unit`` and pass the valid rows to ``on_rows``.
+
+    The ``on_rows`` returns the number of the rows which were not deduplicated
+    away.
+
+    The rows are validated and repaired where possible. The lines of the rows
+    which can not be repaired are requested once more in a follow-up prompt
+    with the same instructions, and its invalid rows are discarded.
+
+    Every request is measured in the ``recorder``, if given.
+    """
+
+    async def request(current: Unit, follow_up: bool) -> validation.AnswerValidator:
+        """Request the ``current`` unit and pass on its valid rows."""
+        validator = make_validator(current)
+
+        request_metrics = (
+            recorder.start(
+                batch_index=current.batch_index,
+                part_of_speech=(
+                    current.part_of_speech.value
+                    if current.part_of_speech is not None
+                    else None
+                ),
+                follow_up=follow_up,
+            )
+            if recorder is not None
+            else None
+        )
+
+        def pass_rows(rows: List[List[str]]) -> None:
+            start = time.perf_counter()
+            valid_rows = normalize_rows(unit=unit, rows=validator.check(rows))
+
+            if request_metrics is not None:
+                request_metrics.parse_time += time.perf_counter() - start
+
+            written_count = on_rows(unit, valid_rows)
+
+            if request_metrics is not None:
+                request_metrics.row_count += len(valid_rows)
+                request_metrics.duplicate_count += len(valid_rows) - written_count
+
+        await _request(
+            unit=current,
+            backend=backend,
+            route=route,
+            semaphore=semaphore,
+            rate_limiter=rate_limiter,
+            count_tokens=count_tokens,
+            cache=cache,
+            stream=stream,
+            retry_policy=retry_policy,
+            on_rows=pass_rows,
+            usage=usage,
+            request_metrics=request_metrics,
+        )
+
+        return validator
+
+    validator = await request(unit, follow_up=False)
+
+    failed_lines = validator.failed_lines
+    statistics.add(validator, requested_line_count=len(failed_lines))
+
+    if len(failed_lines) > 0:
+        follow_up_validator = await request(
+            unit.with_batch("".join(failed_lines)), follow_up=True
+        )
+        statistics.add(follow_up_validator, requested_line_count=0)
+
+
+async def _receive_stream(
+    backend: backends.Backend,
+    model: str,
+    messages: List[Dict[str, str]],
+    parameters: Mapping[str, Any],
+    on_rows: Callable[[List[List[str]]], None],
+    request_metrics: Optional[metrics.RequestMetrics],
+) -> str:
+    """
+    Stream the completion, pass on the rows as they complete and return the answer.
+
+    The parse time is measured in the ``request_metrics``, if given.
+    """
+    parser = streaming.IncrementalCsvParser()
+    parts = []  # type: List[str]
+
+    def parse(content: Optional[str]) -> None:
+        start = time.perf_counter()
+        rows = parser.feed(content) if content is not None else parser.finish()
+
+        if request_metrics is not None:
+            request_metrics.parse_time += time.perf_counter() - start
+
+        if len(rows) > 0:
+            on_rows(rows)
+
+    async for content in backend.stream(
+        model=model, messages=messages, parameters=parameters
+    ):
+        parts.append(content)
+        parse(content)
+
+    parse(None)
+
+    return "".join(parts)
+
+
+def generate_units(
+    batches: Iterable[str],
+    source_language: str,
+    target_language: str,
+    prompt_mode: PromptMode,
+) -> Iterator[Unit]:
+    """Lazily generate the units of work for the ``batches``."""
+    for batch_index, batch in enumerate(batches):
+        if prompt_mode is PromptMode.SEPARATE:
+            for part_of_speech in PartOfSpeech:
+                yield Unit(
+                    batch_index=batch_index,
+                    part_of_speech=part_of_speech,
+                    source_language=source_language,
+                    target_language=target_language,
+                    batch=batch,
+                )
+        elif prompt_mode is PromptMode.COMBINED:
+            yield Unit(
+                batch_index=batch_index,
+                part_of_speech=None,
+                source_language=source_language,
+                target_language=target_language,
+                batch=batch,
+            )
+        else:
+            raise AssertionError(f"Unexpected prompt mode: {prompt_mode}")
+
+
+def compute_prompt_overhead(
+    source_language: str,
+    target_language: str,
+    prompt_mode: PromptMode,
+    count_tokens: tokenizing.TokenCounter,
+) -> int:
+    """Count the tokens of the longest prompt template without the batch."""
+    units = generate_units(
+        batches=[""],
+        source_language=source_language,
+        target_language=target_language,
+        prompt_mode=prompt_mode,
+    )
+    return max(count_tokens(unit.prompt) for unit in units)
+
+
+def normalize_rows(unit: Unit, rows: Iterable[List[str]]) -> List[List[str]]:
+    """
+    Normalize the ``rows`` of the answer to the ``unit`` to the five-column rows.
+
+    The fifth column is the part of speech: either of the ``unit`` or, for
+    the combined prompts, as given in the answer. The rows with neither four nor
+    five columns, including the empty ones, are dropped.
+
+    >>> unit = Unit(
+    ...     batch_index=0,
+    ...     part_of_speech=None,
+    ...     source_language="Russian",
+    ...     target_language="English",
+    ...     batch="",
+    ... )
+    >>> normalize_rows(unit, [["дом", "house", "Дом.", "Home.", "Noun"], ["дом"]])
+    [['дом', 'house', 'Дом.', 'Home.', 'noun']]
+    """
+    result = []  # type: List[List[str]]
+
+    for row in rows:
+        if len(row) not in (4, 5):
+            continue
+
+        if unit.part_of_speech is not None:
+            part_of_speech = unit.part_of_speech.value
+        elif len(row) == 5:
+            part_of_speech = row[4].strip().lower()
+        else:
+            part_of_speech = ""
+
+        result.append(row[:4] + [part_of_speech])
+
+    return result
+
+
+@require(lambda max_concurrency: max_concurrency > 0)
+async def execute_units(
+    units: Iterable[Unit],
+    backend: backends.Backend,
+    routing_table: routing.RoutingTable,
+    max_concurrency: int,
+    rate_limiter: rate_limiting.RateLimiter,
+    count_tokens: tokenizing.TokenCounter,
+    cache: Optional[caching.Cache],
+    stream: bool,
+    retry_policy: retrying.RetryPolicy,
+    on_rows: Callable[[Unit, List[List[str]]], int],
+    on_completed: Callable[[Unit], None],
+    statistics: validation.Statistics,
+    usage: backends.Usage,
+    recorder: Optional[metrics.Recorder],
+) -> Optional[str]:
+    """
+    Send all the ``units`` concurrently to the ``backend``.
+
+    Every unit is sent to the model of its route in the ``routing_table``.
+
+    The ``units`` are consumed lazily so that the first requests go out before
+    the whole input has been read, and only a small window of units is held in
+    memory at any time.
+
+    At most ``max_concurrency`` requests are in flight at any time, and they are
+    further throttled by the ``rate_limiter``. The answers found in the ``cache``
+    are not requested again. The ``on_rows`` is called as soon as the rows of
+    an answer arrive, possibly multiple times per unit if ``stream`` is set, and
+    returns the number of the rows which were not deduplicated away.
+    The ``on_completed`` is called once all the rows of a unit have been passed on.
+    The validation of the answers is summed up in the ``statistics``, and
+    the tokens of the requests in the ``usage``. Every request is measured in
+    the ``recorder``, if given.
+
+    The units which fail even after the retries are reported on STDERR, but do not
+    stop the other units.
+
+    Return an error, if any.
+    """
+
+    async def execute(unit: Unit) -> Tuple[Unit, Optional[str]]:
+        try:
+            await _complete(
+                unit=unit,
+                backend=backend,
+                route=routing_table.route(unit.key[1]),
+                semaphore=semaphore,
+                rate_limiter=rate_limiter,
+                count_tokens=count_tokens,
+                cache=cache,
+                stream=stream,
+                retry_policy=retry_policy,
+                on_rows=on_rows,
+                statistics=statistics,
+                usage=usage,
+                recorder=recorder,
+            )
+        except openai.error.AuthenticationError:
+            raise
+        except (openai.error.OpenAIError, asyncio.TimeoutError) as exception:
+            return unit, f"{type(exception).__name__} {exception}"
+
+        return unit, None
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    # NOTE (mristin):
+    # We keep twice as many units scheduled as there can be requests in flight,
+    # so that the next prompt is always ready when a request finishes.
+    window = 2 * max_concurrency
+
+    unit_iterator = iter(units)
+    pending = set()  # type: Set[asyncio.Task[Tuple[Unit, Optional[str]]]]
+
+    unit_count = 0
+    failed_count = 0
+
+    try:
+        while True:
+            for unit in itertools.islice(unit_iterator, window - len(pending)):
+                pending.add(asyncio.create_task(execute(unit)))
+                unit_count += 1
+
+            if len(pending) == 0:
+                break
+
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for task in done:
+                try:
+                    unit, error = task.result()
+                except openai.error.AuthenticationError as exception:
+                    return f"Failed to authenticate with OpenAI: {exception}"
+
+                if error is not None:
+                    print(f"Failed to complete {unit}: {error}", file=sys.stderr)
+                    failed_count += 1
+                    continue
+
+                on_completed(unit)
+    finally:
+        for task in pending:
+            task.cancel()
+
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if failed_count > 0:
+        return (
+            f"Failed to complete {failed_count} of {unit_count} prompt(s), "
+            f"see the errors above."
+        )
+
+    return None
+
+
+def main(prog: str) -> int:
+    """
+    Execute the main routine.
+
+    :param prog: name of the program to be displayed in the help
+    :return: exit code
+    """
+    parser = argparse.ArgumentParser(prog=prog, description=__doc__)
+    parser.add_argument(
+        "--source_language", help="source language of the text", default="Russian"
+    )
+    parser.add_argument(
+        "--target_language",
+        help="target language which we already master",
+        default="English",
+    )
+    parser.add_argument(
+        "--text",
+        help="Text that we want to extract the flash cards from",
+    )
+    parser.add_argument(
+        "--text_path",
+        help=(
+            "Path to the text file that we want to extract the flash cards from, "
+            "or '-' to read it from STDIN. The text is read lazily so that "
+            "the prompts are sent before the whole text has been read. "
+            "The gzip, bz2, xz and zstd compressions are detected from "
+            "the magic bytes and decompressed on the fly; zstd requires "
+            "the zstandard package. "
+            "Either --text or --text_path needs to be specified, but not both."
+        ),
+    )
+    parser.add_argument(
+        "--openai_key_path",
+        help="Path to the text file containing the OpenAI key",
+        default="openai-key.txt",
+    )
+    parser.add_argument(
+        "--output_path",
+        help="Path where to store the output. If not specified, output to STDOUT",
+    )
+    parser.add_argument(
+        "--output_format",
+        help=(
+            "Format of the output. The CSV and its compressed variants omit "
+            "the part of speech so that they can be fed into csv-to-anki, while "
+            "JSONL, Parquet and SQLite include it; the SQLite table is indexed "
+            "by word and part of speech. Only CSV and JSONL can go to STDOUT, "
+            "and only CSV, JSONL and SQLite can be resumed. The csv.zst needs "
+            "the zstandard and the parquet needs the pyarrow package"
+        ),
+        choices=[output_format.value for output_format in sinks.OutputFormat],
+        default=sinks.OutputFormat.CSV.value,
+    )
+    parser.add_argument(
+        "--flush_interval",
+        help=(
+            "Maximum delay in seconds before the written rows are flushed and "
+            "synced to the output and the completed prompts are recorded in "
+            "the journal. "
+            "The output is written on a background thread which flushes in groups, "
+            "and always on exit"
+        ),
+        type=float,
+        default=1.0,
+    )
+    parser.add_argument(
+        "--flush_rows",
+        help="Number of the written rows which trigger a flush before --flush_interval",
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--max_concurrency",
+        help="Maximum number of prompts sent to ChatGPT at the same time",
+        type=int,
+        default=8,
+    )
+    parser.add_argument(
+        "--rpm",
+        help=(
+            "Quota of requests per minute for OpenAI. The requests are spread "
+            "evenly with bursts of at most two seconds of the quota. "
+            "If not specified, the requests are not throttled"
+        ),
+        type=int,
+    )
+    parser.add_argument(
+        "--tpm",
+        help=(
+            "Quota of tokens per minute for OpenAI. The tokens are spread "
+            "evenly with bursts of at most two seconds of the quota. "
+            "If not specified, the tokens are not throttled"
+        ),
+        type=int,
+    )
+    parser.add_argument(
+        "--prompt_mode",
+        help=(
+            "How to prompt for the parts of speech: either one prompt per "
+            "part of speech for each batch, or one combined prompt for each batch"
+        ),
+        choices=[prompt_mode.value for prompt_mode in PromptMode],
+        default=PromptMode.SEPARATE.value,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help=(
+            "Directory where the completions are cached across the runs. "
+            "If not specified, the completions are not cached"
+        ),
+    )
+    parser.add_argument(
+        "--cache_max_size",
+        help="Maximum size of the cached completions in megabytes",
+        type=int,
+        default=512,
+    )
+    parser.add_argument(
+        "--max_prompt_tokens",
+        help=(
+            "If set, pack the lines into batches so that every prompt, "
+            "including the instructions, has at most this many tokens. "
+            "The tokens are counted with tiktoken, if installed, or estimated "
+            "otherwise. If not set, the text is split into batches of "
+            "500 characters"
+        ),
+        type=int,
+    )
+    parser.add_argument(
+        "--stream",
+        help=(
+            "If set, stream the completions and write every row as soon as "
+            "it has been received"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max_attempts",
+        help="Maximum number of attempts per prompt on the transient OpenAI errors",
+        type=int,
+        default=5,
+    )
+    parser.add_argument(
+        "--request_timeout",
+        help="Deadline of a single request to OpenAI in seconds",
+        type=float,
+        default=300.0,
+    )
+    parser.add_argument(
+        "--model",
+        help="Model which completes the prompts, unless routed otherwise",
+        default="gpt-4-turbo-preview",
+    )
+    parser.add_argument(
+        "--max_tokens",
+        help=(
+            "If set, limit the tokens of every answer, unless routed otherwise. "
+            "Too tight a limit truncates the answers"
+        ),
+        type=int,
+    )
+    parser.add_argument(
+        "--temperature",
+        help="If set, sample the answers with this temperature, unless routed otherwise",
+        type=float,
+    )
+    parser.add_argument(
+        "--fallback_model",
+        help=(
+            "If set, send the prompt to this model if the model fails even after "
+            "the retries, unless routed otherwise"
+        ),
+    )
+    parser.add_argument(
+        "--routing_path",
+        help=(
+            "If set, route the prompts by their kind (a part of speech, or "
+            "'combined') according to this JSON file, e.g., "
+            '{"adverb": {"model": "gpt-3.5-turbo", "max_tokens": 1024}}. '
+            "The settings model, max_tokens, temperature and fallback_model "
+            "default to the respective arguments"
+        ),
+    )
+    parser.add_argument(
+        "--route",
+        help=(
+            "Route the prompts of a kind as KIND:MODEL[,KEY=VALUE...], e.g., "
+            "adverb:gpt-3.5-turbo,max_tokens=1024,temperature=0. "
+            "Replaces the route of the kind in --routing_path. Can be repeated"
+        ),
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--backend",
+        help=(
+            "Backend which completes the prompts. The fake backend synthesizes "
+            "the answers locally for benchmarking, and needs no OpenAI key"
+        ),
+        choices=["openai", "fake"],
+        default="openai",
+    )
+    parser.add_argument(
+        "--fake_latency",
+        help="Mean latency of a request to the fake backend in seconds",
+        type=float,
+        default=1.0,
+    )
+    parser.add_argument(
+        "--fake_error_rate",
+        help="Probability that a request to the fake backend fails transiently",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--fake_seed",
+        help=(
+            "Seed of the random latencies and failures of the fake backend "
+            "so that the runs can be compared"
+        ),
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--known_words_path",
+        help=(
+            "If set, skip the words which are already in this SQLite store of "
+            "the known words, and add the newly extracted words to it. "
+            "See import-known-words to seed the store from the existing CSV files"
+        ),
+    )
+    parser.add_argument(
+        "--skip_known_lines",
+        help=(
+            "If set, do not send the lines whose every word is already "
+            "in --known_words_path. The words are matched by their exact "
+            "normalized form, so the inflected forms still need to be sent"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--deduplicate_lines",
+        help=(
+            "If set, send every line of the text only once, even if it repeats, "
+            "e.g., in the lyrics or subtitles"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--line_occurrences_path",
+        help=(
+            "If set, write every unique line of the text together with the line "
+            "numbers of all its occurrences to this JSONL file; "
+            "requires --deduplicate_lines"
+        ),
+    )
+    parser.add_argument(
+        "--emit_requests",
+        help=(
+            "If set, do not prompt ChatGPT, but write the requests to this JSONL "
+            "file to be run as an offline batch job"
+        ),
+    )
+    parser.add_argument(
+        "--ingest_results",
+        help=(
+            "If set, do not prompt ChatGPT, but read the answers from this JSONL "
+            "file with the results of the batch job from --emit_requests"
+        ),
+    )
+    parser.add_argument(
+        "--metrics_path",
+        help=(
+            "If set, write the tokens, the timings and the cost of every request "
+            "together with their summary to this JSON file, or to a JSONL file "
+            "if it ends with .jsonl"
+        ),
+    )
+    parser.add_argument(
+        "--prompt_token_price",
+        help=(
+            "If set, include the cost in --metrics_path with this price of "
+            "the prompt tokens in USD per million tokens"
+        ),
+        type=float,
+    )
+    parser.add_argument(
+        "--cached_token_price",
+        help=(
+            "Price of the cached prompt tokens in USD per million tokens; "
+            "defaults to --prompt_token_price"
+        ),
+        type=float,
+    )
+    parser.add_argument(
+        "--completion_token_price",
+        help=(
+            "Price of the completion tokens in USD per million tokens; "
+            "required with --prompt_token_price"
+        ),
+        type=float,
+    )
+    parser.add_argument(
+        "--profile",
+        help=(
+            "If set, report on STDERR how much time was spent in the individual "
+            "stages of the run. The stages overlap since the requests are sent "
+            "concurrently and the output is written in the background"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile_path",
+        help=(
+            "If set, additionally profile the run with cProfile and dump "
+            "the statistics to this file; requires --profile"
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        help=(
+            "If set, resume the interrupted run from the journal next to "
+            "--output_path: skip the completed prompts and append to the output. "
+            "The journal is only written for the formats which can be appended to"
+        ),
+        action="store_true",
+    )
+
+    args = parser.parse_args()
+
+    source_language = str(args.source_language)
+    target_language = str(args.target_language)
+    text = args.text if args.text is not None else None
+    text_path = pathlib.Path(args.text_path) if args.text_path is not None else None
+    openai_key_path = pathlib.Path(args.openai_key_path)
+    output_path = (
+        pathlib.Path(args.output_path) if args.output_path is not None else None
+    )
+    output_format = sinks.OutputFormat(args.output_format)
+    flush_interval = float(args.flush_interval)
+    flush_rows = int(args.flush_rows)
+    max_concurrency = int(args.max_concurrency)
+    rpm = int(args.rpm) if args.rpm is not None else None
+    tpm = int(args.tpm) if args.tpm is not None else None
+    prompt_mode = PromptMode(args.prompt_mode)
+    cache_dir = pathlib.Path(args.cache_dir) if args.cache_dir is not None else None
+    cache_max_size = int(args.cache_max_size)
+    max_prompt_tokens = (
+        int(args.max_prompt_tokens) if args.max_prompt_tokens is not None else None
+    )
+    stream = bool(args.stream)
+    max_attempts = int(args.max_attempts)
+    request_timeout = float(args.request_timeout)
+    known_words_path = (
+        pathlib.Path(args.known_words_path)
+        if args.known_words_path is not None
+        else None
+    )
+    skip_known_lines = bool(args.skip_known_lines)
+    should_deduplicate_lines = bool(args.deduplicate_lines)
+    line_occurrences_path = (
+        pathlib.Path(args.line_occurrences_path)
+        if args.line_occurrences_path is not None
+        else None
+    )
+    model = str(args.model)
+    max_tokens = int(args.max_tokens) if args.max_tokens is not None else None
+    temperature = float(args.temperature) if args.temperature is not None else None
+    fallback_model = (
+        str(args.fallback_model) if args.fallback_model is not None else None
+    )
+    routing_path = (
+        pathlib.Path(args.routing_path) if args.routing_path is not None else None
+    )
+    route_specs = [str(route_spec) for route_spec in args.route]
+    backend_name = str(args.backend)
+    fake_latency = float(args.fake_latency)
+    fake_error_rate = float(args.fake_error_rate)
+    fake_seed = int(args.fake_seed)
+    emit_requests = (
+        pathlib.Path(args.emit_requests) if args.emit_requests is not None else None
+    )
+    ingest_results = (
+        pathlib.Path(args.ingest_results) if args.ingest_results is not None else None
+    )
+    resume = bool(args.resume)
+    metrics_path = (
+        pathlib.Path(args.metrics_path) if args.metrics_path is not None else None
+    )
+    profile = bool(args.profile)
+    profile_path = (
+        pathlib.Path(args.profile_path) if args.profile_path is not None else None
+    )
+    prompt_token_price = (
+        float(args.prompt_token_price) if args.prompt_token_price is not None else None
+    )
+    cached_token_price = (
+        float(args.cached_token_price) if args.cached_token_price is not None else None
+    )
+    completion_token_price = (
+        float(args.completion_token_price)
+        if args.completion_token_price is not None
+        else None
+    )
+
+    if text is not None and text_path is not None:
+        print(
+            "Both --text and --text_path has been specified. You must specify only "
+            "either one of them.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if text is None and text_path is None:
+        print("Neither --text nor --text_path has been specified.", file=sys.stderr)
+        return 1
+
+    if flush_interval < 0.0:
+        print(
+            f"--flush_interval must be non-negative, but got: {flush_interval}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if flush_rows <= 0:
+        print(
+            f"--flush_rows must be positive, but got: {flush_rows}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if max_concurrency <= 0:
+        print(
+            f"--max_concurrency must be positive, but got: {max_concurrency}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if rpm is not None and rpm <= 0:
+        print(f"--rpm must be positive, but got: {rpm}", file=sys.stderr)
+        return 1
+
+    if tpm is not None and tpm <= 0:
+        print(f"--tpm must be positive, but got: {tpm}", file=sys.stderr)
+        return 1
+
+    if cache_max_size <= 0:
+        print(
+            f"--cache_max_size must be positive, but got: {cache_max_size}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if max_prompt_tokens is not None and max_prompt_tokens <= 0:
+        print(
+            f"--max_prompt_tokens must be positive, but got: {max_prompt_tokens}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if max_attempts <= 0:
+        print(
+            f"--max_attempts must be positive, but got: {max_attempts}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if request_timeout <= 0.0:
+        print(
+            f"--request_timeout must be positive, but got: {request_timeout}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if fake_latency < 0.0:
+        print(
+            f"--fake_latency must be non-negative, but got: {fake_latency}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if not 0.0 <= fake_error_rate <= 1.0:
+        print(
+            f"--fake_error_rate must be in [0, 1], but got: {fake_error_rate}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if model.strip() == "":
+        print("--model must not be empty.", file=sys.stderr)
+        return 1
+
+    if max_tokens is not None and max_tokens <= 0:
+        print(f"--max_tokens must be positive, but got: {max_tokens}", file=sys.stderr)
+        return 1
+
+    if temperature is not None and not 0.0 <= temperature <= 2.0:
+        print(
+            f"--temperature must be in [0, 2], but got: {temperature}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if fallback_model is not None and fallback_model.strip() == "":
+        print("--fallback_model must not be empty.", file=sys.stderr)
+        return 1
+
+    default_route = routing.Route(
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        fallback_model=fallback_model,
+    )
+
+    prompt_kinds = [part_of_speech.value for part_of_speech in PartOfSpeech] + [
+        routing.COMBINED
+    ]
+
+    routes = dict()  # type: Dict[str, routing.Route]
+    if routing_path is not None:
+        loaded_routes, error = routing.load(
+            path=routing_path, base=default_route, kinds=prompt_kinds
+        )
+        if error is not None:
+            print(f"--routing_path {routing_path}: {error}", file=sys.stderr)
+            return 1
+
+        assert loaded_routes is not None
+        routes.update(loaded_routes)
+
+    for route_spec in route_specs:
+        kind_and_route, error = routing.parse_route(
+            text=route_spec, base=default_route, kinds=prompt_kinds
+        )
+        if error is not None:
+            print(f"--route: {error}", file=sys.stderr)
+            return 1
+
+        assert kind_and_route is not None
+        kind, route = kind_and_route
+        routes[kind] = route
+
+    routing_table = routing.RoutingTable(default=default_route, routes=routes)
+
+    if skip_known_lines and known_words_path is None:
+        print(
+            "--skip_known_lines requires --known_words_path to be specified.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if emit_requests is not None and ingest_results is not None:
+        print(
+            "Both --emit_requests and --ingest_results have been specified. "
+            "You must specify only either one of them.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if ingest_results is not None and not ingest_results.is_file():
+        print(
+            f"--ingest_results does not exist or is not a file: {ingest_results}",
+            file=sys.stderr,
+        )
+        return 1
+
+    if resume and output_path is None:
+        print("--resume requires --output_path to be specified.", file=sys.stderr)
+        return 1
+
+    for flag, price in [
+        ("--prompt_token_price", prompt_token_price),
+        ("--cached_token_price", cached_token_price),
+        ("--completion_token_price", completion_token_price),
+    ]:
+        if price is not None and price < 0.0:
+            print(f"{flag} must be non-negative, but got: {price}", file=sys.stderr)
+            return 1
+
+    if (prompt_token_price is None) != (completion_token_price is None):
+        print(
+            "--prompt_token_price and --completion_token_price must be "
+            "specified together.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if cached_token_price is not None and prompt_token_price is None:
+        print(
+            "--cached_token_price requires --prompt_token_price to be specified.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if line_occurrences_path is not None and not should_deduplicate_lines:
+        print(
+            "--line_occurrences_path requires --deduplicate_lines to be specified.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if prompt_token_price is not None and metrics_path is None:
+        print(
+            "--prompt_token_price requires --metrics_path to be specified.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if profile_path is not None and not profile:
+        print("--profile_path requires --profile to be specified.", file=sys.stderr)
+        return 1
+
+    if output_path is None and output_format not in sinks.TEXT_FORMATS:
+        print(
+            f"--output_format {output_format.value} requires --output_path "
+            f"to be specified.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if resume and output_format not in sinks.APPENDABLE_FORMATS:
+        print(
+            f"--resume is not supported for --output_format {output_format.value}.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if text_path is not None and str(text_path) != "-" and not text_path.is_file():
+        print(
+            f"--text_path does not exist or is not a file: {text_path}",
+            file=sys.stderr,
+        )
+        return 1
+
+    # NOTE (mristin):
+    # The stages are always timed as it costs next to nothing, but only reported
+    # if --profile has been specified.
+    profiler = profiling.StageProfiler(cprofile_path=profile_path)
+    profiler.start()
+
+    if backend_name == "openai" and emit_requests is None and ingest_results is None:
+        if not openai_key_path.exists():
+            print(
+                f"--openai_key_path does not exist: {openai_key_path}",
+                file=sys.stderr,
+            )
+            return 1
+
+        if not openai_key_path.is_file():
+            print(
+                f"--openai_key_path is not a file: {openai_key_path}", file=sys.stderr
+            )
+            return 1
+
+        try:
+            with profiler.stage("key loading"):
+                openai_key = openai_key_path.read_text(encoding="utf-8").strip()
+        except Exception as exception:
+            print(f"Failed to read {openai_key_path}: {exception}", file=sys.stderr)
+            return 1
+
+        openai.api_key = openai_key
+
+    # NOTE (mristin):
+    # We size the batches with the tokenizer of the default model, even if some
+    # prompts are routed to other models, as the tokenizers hardly differ for
+    # the purpose of rate limiting and batching.
+    count_tokens = tokenizing.make_token_counter(model)
+
+    max_batch_tokens = None  # type: Optional[int]
+    if max_prompt_tokens is not None:
+        prompt_overhead = compute_prompt_overhead(
+            source_language=source_language,
+            target_language=target_language,
+            prompt_mode=prompt_mode,
+            count_tokens=count_tokens,
+        )
+        if prompt_overhead >= max_prompt_tokens:
+            print(
+                f"--max_prompt_tokens {max_prompt_tokens} leaves no room for "
+                f"the text as the instructions alone take {prompt_overhead} tokens.",
+                file=sys.stderr,
+            )
+            return 1
+
+        max_batch_tokens = max_prompt_tokens - prompt_overhead
+
+    # NOTE (mristin):
+    # The text is streamed, so we can not fingerprint it before the run. We only
+    # fingerprint the instructions here, while the journal records the fingerprint
+    # of every completed prompt.
+    fingerprint = journaling.compute_fingerprint(
+        unit.prompt
+        for unit in generate_units(
+            batches=[""],
+            source_language=source_language,
+            target_language=target_language,
+            prompt_mode=prompt_mode,
+        )
+    )
+
+    journal_path = (
+        output_path.parent / f"{output_path.name}.journal"
+        if output_path is not None
+        else None
+    )
+
+    # NOTE (mristin):
+    # The deduplicator holds both the known words and the words observed in
+    # this run.
+    deduplicator = dedup.Deduplicator()
+
+    state = None  # type: Optional[journaling.State]
+    if resume:
+        assert output_path is not None
+        assert journal_path is not None
+
+        if journal_path.exists() != output_path.exists():
+            # NOTE (mristin):
+            # We refuse to start anew as we would overwrite the existing output.
+            print(
+                f"Failed to --resume: the output {output_path} and its journal "
+                f"{journal_path} need to either both exist or both be missing, "
+                f"but only the "
+                f"{'output' if output_path.exists() else 'journal'} exists.",
+                file=sys.stderr,
+            )
+            return 1
+
+        if journal_path.exists() and output_path.exists():
+            state, error = journaling.load(journal_path)
+            if error is not None:
+                print(f"Failed to --resume: {error}", file=sys.stderr)
+                return 1
+
+            assert state is not None
+            if state.fingerprint != fingerprint:
+                print(
+                    f"Failed to --resume: the journal {journal_path} belongs to "
+                    f"a run with different languages or prompts.",
+                    file=sys.stderr,
+                )
+                return 1
+
+            deduplicator.update(state.observed)
+
+            if output_format in sinks.TEXT_FORMATS:
+                sinks.truncate_partial_line(output_path)
+
+            # NOTE (mristin):
+            # The rows might have been written just before the crash without
+            # making it to the journal, so we observe the output as well.
+            deduplicator.update(
+                sinks.iterate_words(path=output_path, output_format=output_format)
+            )
+
+            print(
+                f"Resuming from {journal_path}: {len(state.completed)} "
+                f"prompt(s) have been already completed.",
+                file=sys.stderr,
+            )
+
+    resuming = state is not None
+
+    # NOTE (mristin):
+    # We filter the lines with a separate snapshot of the known words as the lines
+    # are read while the words are being observed. Otherwise, the batches would
+    # depend on the order in which the answers arrive.
+    known = None  # type: Optional[dedup.Deduplicator]
+
+    if known_words_path is not None:
+        known_words_path.parent.mkdir(parents=True, exist_ok=True)
+        store = vocabulary.KnownWords(path=known_words_path)
+        try:
+            deduplicator.update(store.iterate(language=source_language))
+
+            if skip_known_lines:
+                # NOTE (mristin):
+                # The store already contains the words committed by the resumed
+                # run. We leave them out of the snapshot so that the lines, and
+                # hence the batches, are the same as in the resumed run.
+                resumed_words = (
+                    {vocabulary.normalize_word(word) for word in state.observed}
+                    if state is not None
+                    else set()
+                )
+
+                known = dedup.Deduplicator()
+                known.update(
+                    word
+                    for word in store.iterate(language=source_language)
+                    if word not in resumed_words
+                )
+        finally:
+            store.close()
+
+    for kind, route in routing_table.routes.items():
+        print(f"Routing the prompts for {kind} to {route}.", file=sys.stderr)
+
+    with contextlib.ExitStack() as exit_stack:
+        if profile:
+            exit_stack.callback(profiler.stop, sys.stderr)
+
+        exit_stack.callback(deduplicator.close)
+        if known is not None:
+            exit_stack.callback(known.close)
+
+        # NOTE (mristin):
+        # We estimate the progress of the lazy input from the read position in
+        # the text file, as the total number of the units is only known at the end.
+        input_raw = None  # type: Optional[io.BufferedReader]
+        input_size = 0
+
+        if text_path is None:
+            assert text is not None
+            text_source = "--text"
+            chunks = [text]  # type: Iterable[str]
+        else:
+            if str(text_path) == "-":
+                text_source = "--text_path - (STDIN)"
+                raw = sys.stdin.buffer
+            else:
+                text_source = f"--text_path {text_path}"
+                raw = exit_stack.enter_context(text_path.open("rb"))
+
+                input_raw = raw
+                input_size = os.fstat(raw.fileno()).st_size
+
+            assert isinstance(raw, io.BufferedReader)
+
+            text_fid, error = compression.open_text(raw=raw, name=str(text_path))
+            if error is not None:
+                print(f"Failed to open {text_source}: {error}", file=sys.stderr)
+                return 1
+
+            assert text_fid is not None
+            chunks = exit_stack.enter_context(text_fid)
+
+        # NOTE (mristin):
+        # The errors of the lazy stages can only surface while the units are
+        # being consumed, so we collect them here and report them at the end.
+        stream_errors = []  # type: List[str]
+
+        def read_chunks() -> Iterator[str]:
+            """Read the ``chunks``, recording the error, if any."""
+            try:
+                yield from chunks
+            except Exception as exception:
+                stream_errors.append(f"Failed to read {text_source}: {exception}")
+
+        # NOTE (mristin):
+        # We number the lines at the source so that the line numbers of the filters
+        # and of the batching errors refer to the input text regardless of the lines
+        # removed before them.
+        numbered_lines = enumerate(
+            iter_lines(read_chunks()), start=1
+        )  # type: Iterable[Tuple[int, str]]
+
+        removed = []  # type: List[int]
+        if known is not None:
+            numbered_lines = remove_known_lines(
+                lines=numbered_lines, known=known, removed=removed
+            )
+
+        occurrences = dedup.LineOccurrences()
+        exit_stack.callback(occurrences.close)
+
+        if should_deduplicate_lines:
+            numbered_lines = deduplicate_lines(
+                lines=numbered_lines, occurrences=occurrences
+            )
+
+        def generate_batches() -> Iterator[str]:
+            """Group the ``numbered_lines`` into batches, recording the error, if any."""
+            if max_batch_tokens is None:
+                batches = iter_batches(lines=numbered_lines, max_batch_length=500)
+            else:
+                batches = iter_token_batches(
+                    lines=numbered_lines,
+                    max_batch_tokens=max_batch_tokens,
+                    count_tokens=count_tokens,
+                )
+
+            for batch, error in batches:
+                if error is not None:
+                    stream_errors.append(
+                        f"{text_source} could not be split into batches "
+                        f"for ChatGPT prompts: {error}"
+                    )
+                    return
+
+                assert batch is not None
+                yield batch
+
+        def skip_completed(units: Iterable[Unit]) -> Iterator[Unit]:
+            """Skip the ``units`` which have been completed in the resumed run."""
+            if state is None:
+                yield from units
+                return
+
+            for unit in units:
+                prompt_fingerprint = state.completed.get(unit.key, None)
+                if prompt_fingerprint is None:
+                    yield unit
+                    continue
+
+                if prompt_fingerprint != journaling.compute_fingerprint([unit.prompt]):
+                    stream_errors.append(
+                        f"Failed to --resume: the journal {journal_path} belongs to "
+                        f"a run with a different text as {unit} differs."
+                    )
+                    return
+
+        reporter = progress.ProgressReporter(stream=sys.stderr, noun="units")
+        exit_stack.callback(reporter.close)
+
+        def track_units(units: Iterable[Unit]) -> Iterator[Unit]:
+            """Count the ``units`` to set or estimate their total for the progress."""
+            count = 0
+            for unit in units:
+                count += 1
+
+                if input_raw is not None and input_size > 0 and not input_raw.closed:
+                    read_fraction = input_raw.tell() / input_size
+                    if read_fraction > 0.0:
+                        reporter.set_total(count / read_fraction, estimated=True)
+
+                yield unit
+
+            reporter.set_total(count, estimated=False)
+
+        units = track_units(
+            skip_completed(
+                generate_units(
+                    batches=profiler.iterate("splitting", generate_batches()),
+                    source_language=source_language,
+                    target_language=target_language,
+                    prompt_mode=prompt_mode,
+                )
+            )
+        )
+
+        statistics = validation.Statistics()
+
+        def report_validation() -> None:
+            """Report the statistics of the answer validation on STDERR."""
+            print(
+                f"Validated the answers: {statistics.repaired_count} row(s) repaired, "
+                f"{statistics.invalid_count} invalid row(s) discarded, "
+                f"{statistics.requested_line_count} line(s) requested again and "
+                f"{statistics.unmatched_count} row(s) kept although their word "
+                f"could not be found in their line.",
+                file=sys.stderr,
+            )
+
+        def write_line_occurrences() -> bool:
+            """Write the occurrences of the lines, and report the failure, if any."""
+            if line_occurrences_path is None:
+                return True
+
+            try:
+                occurrences.write(line_occurrences_path)
+            except Exception as exception:
+                print(
+                    f"Failed to write the line occurrences to --line_occurrences_path "
+                    f"{line_occurrences_path}: {exception}",
+                    file=sys.stderr,
+                )
+                return False
+
+            return True
+
+        def report_lines() -> None:
+            """Report the statistics of the line filters on STDERR."""
+            if known is not None:
+                print(
+                    f"Skipped {len(removed)} line(s) of {text_source} whose every "
+                    f"word is already known.",
+                    file=sys.stderr,
+                )
+
+            if should_deduplicate_lines:
+                print(
+                    f"Deduplicated {text_source}: {occurrences.unique_count} "
+                    f"unique line(s) out of {occurrences.line_count} non-empty "
+                    f"line(s), {occurrences.repeated_count} of them repeated.",
+                    file=sys.stderr,
+                )
+
+        if emit_requests is not None:
+            request_count = batch_jobs.write_requests(
+                path=emit_requests,
+                requests=(
+                    (
+                        unit.key,
+                        journaling.compute_fingerprint([unit.prompt]),
+                        routing_table.route(unit.key[1]).model,
+                        routing_table.route(unit.key[1]).parameters,
+                        compose_messages(unit),
+                    )
+                    for unit in units
+                ),
+            )
+
+            if not write_line_occurrences():
+                return 1
+
+            report_lines()
+
+            if len(stream_errors) > 0:
+                for error in stream_errors:
+                    print(error, file=sys.stderr)
+                return 1
+
+            print(
+                f"Wrote {request_count} request(s) to --emit_requests {emit_requests}",
+                file=sys.stderr,
+            )
+            return 0
+
+        sink, error = sinks.open_sink(
+            output_format=output_format,
+            path=output_path,
+            source_language=source_language,
+            target_language=target_language,
+            append=resuming,
+        )
+        if error is not None:
+            print(f"Failed to open the output: {error}", file=sys.stderr)
+            return 1
+
+        assert sink is not None
+        exit_stack.callback(sink.close)
+
+        sink.flush()
+
+        # NOTE (mristin):
+        # The outputs which can not be appended to can not be resumed either, so
+        # we do not journal them.
+        journal = None  # type: Optional[journaling.Journal]
+        if output_path is not None and output_format in sinks.APPENDABLE_FORMATS:
+            assert journal_path is not None
+            journal = journaling.Journal(
+                path=journal_path, fingerprint=fingerprint, append=resuming
+            )
+            exit_stack.callback(journal.close)
+
+        cache = None  # type: Optional[caching.Cache]
+        if cache_dir is not None:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            cache = caching.Cache(
+                path=cache_dir / "completions.sqlite",
+                max_size=cache_max_size * 1024 * 1024,
+            )
+            exit_stack.callback(cache.close)
+
+        known_words = None  # type: Optional[vocabulary.KnownWords]
+        if known_words_path is not None:
+            known_words = vocabulary.KnownWords(path=known_words_path)
+            exit_stack.callback(known_words.close)
+
+        def commit(completions: List[Tuple[Unit, List[str]]]) -> None:
+            """Record the units and their words once their rows have been flushed."""
+            if journal is not None:
+                journal.record_all(
+                    [
+                        (
+                            unit.key,
+                            journaling.compute_fingerprint([unit.prompt]),
+                            words,
+                        )
+                        for unit, words in completions
+                    ]
+                )
+
+            if known_words is not None:
+                known_words.add(
+                    language=source_language,
+                    words=[word for _, words in completions for word in words],
+                )
+
+        writer = writing.GroupCommitWriter(
+            sink=sink,
+            on_commit=commit,
+            flush_interval=flush_interval,
+            flush_rows=flush_rows,
+        )  # type: writing.GroupCommitWriter[Tuple[Unit, List[str]]]
+        exit_stack.callback(writer.close)
+
+        def close_writer() -> bool:
+            """Commit the remaining output, and report the failure, if any."""
+            try:
+                writer.close()
+            except Exception as exception:
+                print(f"Failed to write the output: {exception}", file=sys.stderr)
+                return False
+
+            profiler.add("writing", writer.write_time, count=writer.flush_count)
+            profiler.add("committing", writer.commit_time, count=writer.flush_count)
+
+            return True
+
+        words_per_unit = dict()  # type: Dict[journaling.UnitKey, List[str]]
+
+        def write_rows(unit: Unit, rows: List[List[str]]) -> int:
+            """Queue the ``rows`` whose words we have not observed yet, count them."""
+            words = words_per_unit.setdefault(unit.key, [])
+
+            new_rows = []  # type: List[List[str]]
+            with profiler.stage("dedup"):
+                for row in rows:
+                    word = row[0]
+
+                    if not deduplicator.add_if_new(word):
+                        continue
+
+                    words.append(word)
+                    new_rows.append(row)
+
+            writer.write(new_rows)
+            return len(new_rows)
+
+        usage = backends.Usage()
+
+        completed_count = 0
+        written_row_count = 0
+
+        def complete_unit(unit: Unit) -> None:
+            """Queue the ``unit`` and its words to be recorded as done."""
+            nonlocal completed_count, written_row_count
+
+            words = words_per_unit.pop(unit.key, [])
+            writer.complete((unit, words))
+
+            completed_count += 1
+            written_row_count += len(words)
+            reporter.update(
+                completed=completed_count,
+                rows=written_row_count,
+                tokens=usage.prompt_tokens + usage.completion_tokens,
+            )
+
+        if ingest_results is not None:
+            answers, errors = batch_jobs.read_results(ingest_results)
+            for error in errors:
+                print(f"--ingest_results {ingest_results}: {error}", file=sys.stderr)
+
+            unit_count = 0
+            missing_count = 0
+            for unit in units:
+                unit_count += 1
+
+                answer = answers.pop(
+                    batch_jobs.compute_custom_id(
+                        unit.key, journaling.compute_fingerprint([unit.prompt])
+                    ),
+                    None,
+                )
+                if answer is None:
+                    missing_count += 1
+                    continue
+
+                # NOTE (mristin):
+                # We can not follow up on the invalid rows of a batch job, so we
+                # only discard them.
+                validator = make_validator(unit)
+                with profiler.stage("parsing"):
+                    rows = normalize_rows(
+                        unit=unit,
+                        rows=validator.check(validation.parse_lines(answer)),
+                    )
+
+                write_rows(unit, rows)
+                statistics.add(validator, requested_line_count=0)
+                complete_unit(unit)
+
+            reporter.close()
+
+            if not close_writer():
+                return 1
+
+            if not write_line_occurrences():
+                return 1
+
+            report_lines()
+            report_validation()
+
+            if len(stream_errors) > 0:
+                for error in stream_errors:
+                    print(error, file=sys.stderr)
+                return 1
+
+            # NOTE (mristin):
+            # The answers to the prompts completed in the resumed run are expected
+            # to be left over.
+            if state is not None:
+                for key, prompt_fingerprint in state.completed.items():
+                    answers.pop(
+                        batch_jobs.compute_custom_id(key, prompt_fingerprint), None
+                    )
+
+            if len(answers) > 0:
+                for custom_id in answers:
+                    print(
+                        f"--ingest_results {ingest_results}: the answer {custom_id} "
+                        f"does not belong to any prompt of this run, e.g., because "
+                        f"the text or the options changed since --emit_requests.",
+                        file=sys.stderr,
+                    )
+                return 1
+
+            if missing_count > 0:
+                print(
+                    f"The answers to {missing_count} of {unit_count} prompt(s) are "
+                    f"missing in --ingest_results {ingest_results}; re-run the batch "
+                    f"job for them and ingest its results with --resume.",
+                    file=sys.stderr,
+                )
+                return 1
+
+            return 0
+
+        backend = (
+            backends.FakeBackend(
+                latency=fake_latency, error_rate=fake_error_rate, seed=fake_seed
+            )
+            if backend_name == "fake"
+            else backends.OpenAIBackend()
+        )  # type: backends.Backend
+
+        recorder = None  # type: Optional[metrics.Recorder]
+        if metrics_path is not None or profile:
+            prices = None  # type: Optional[metrics.Prices]
+            if prompt_token_price is not None:
+                assert completion_token_price is not None
+                prices = metrics.Prices(
+                    prompt=prompt_token_price,
+                    completion=completion_token_price,
+                    cached=(
+                        cached_token_price
+                        if cached_token_price is not None
+                        else prompt_token_price
+                    ),
+                )
+
+            recorder = metrics.Recorder(prices=prices)
+
+        error = asyncio.run(
+            execute_units(
+                units=units,
+                backend=backend,
+                routing_table=routing_table,
+                max_concurrency=max_concurrency,
+                rate_limiter=rate_limiting.RateLimiter(
+                    requests_per_minute=rpm, tokens_per_minute=tpm
+                ),
+                count_tokens=count_tokens,
+                cache=cache,
+                stream=stream,
+                retry_policy=retrying.RetryPolicy(
+                    max_attempts=max_attempts, timeout=request_timeout
+                ),
+                on_rows=write_rows,
+                on_completed=complete_unit,
+                statistics=statistics,
+                usage=usage,
+                recorder=recorder,
+            )
+        )
+
+        reporter.close()
+
+        if recorder is not None:
+            profiler.add(
+                "waiting",
+                sum(record.queue_wait for record in recorder.records),
+                count=len(recorder.records),
+                overlapping=True,
+            )
+            profiler.add(
+                "prompting",
+                sum(record.latency for record in recorder.records),
+                count=len(recorder.records),
+                overlapping=True,
+            )
+            profiler.add(
+                "parsing",
+                sum(record.parse_time for record in recorder.records),
+                count=len(recorder.records),
+            )
+
+        if recorder is not None and metrics_path is not None:
+            try:
+                recorder.write(metrics_path)
+            except Exception as exception:
+                print(
+                    f"Failed to write the metrics to --metrics_path {metrics_path}: "
+                    f"{exception}",
+                    file=sys.stderr,
+                )
+                return 1
+
+        if not close_writer():
+            return 1
+
+        if not write_line_occurrences():
+            return 1
+
+        report_lines()
+        report_validation()
+
+        print(
+            f"Sent {usage.request_count} request(s) with {usage.prompt_tokens} "
+            f"prompt token(s), of which {usage.cached_tokens} "
+            f"({usage.cached_ratio:.0%}) were cached, "
+            f"and received {usage.completion_tokens} completion token(s).",
+            file=sys.stderr,
+        )
+
+        if cache is not None:
+            print(
+                f"Cache {cache.path}: {cache.hits} hit(s), {cache.misses} miss(es)",
+                file=sys.stderr,
+            )
+
+        for stream_error in stream_errors:
+            print(stream_error, file=sys.stderr)
 
-                    observed_set.add(word)
+        if error is not None:
+            print(error, file=sys.stderr)
 
-                    writer.writerow(row)
+        if error is not None or len(stream_errors) > 0:
+            return 1
 
-                if fid is not None:
-                    fid.flush()
     return 0
 
 
@@ -0,0 +1,266 @@
+"""Record the tokens, the timings and the cost of every request."""
+
+import json
+import math
+import pathlib
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from icontract import require
+
+
+@require(lambda values: len(values) > 0)
+@require(lambda quantile: 0.0 <= quantile <= 1.0)
+def percentile(values: Sequence[float], quantile: float) -> float:
+    """
+    Compute the ``quantile`` of the ``values`` by linear interpolation.
+
+    >>> percentile([1.0, 2.0, 3.0, 4.0], 0.5)
+    2.5
+    >>> percentile([3.0, 1.0, 2.0], 0.99)
+    2.98
+    >>> percentile([7.0], 0.95)
+    7.0
+    """
+    ordered = sorted(values)
+
+    position = (len(ordered) - 1) * quantile
+    lower = math.floor(position)
+    upper = math.ceil(position)
+
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize_distribution(values: Sequence[float]) -> Dict[str, float]:
+    """
+    Summarize the ``values`` with their mean, median and the tail percentiles.
+
+    >>> summarize_distribution([1.0, 2.0, 3.0, 4.0])
+    {'mean': 2.5, 'p50': 2.5, 'p95': 3.85, 'p99': 3.97, 'max': 4.0}
+    >>> summarize_distribution([])
+    {}
+    """
+    if len(values) == 0:
+        return dict()
+
+    return {
+        "mean": round(sum(values) / len(values), 6),
+        "p50": round(percentile(values, 0.5), 6),
+        "p95": round(percentile(values, 0.95), 6),
+        "p99": round(percentile(values, 0.99), 6),
+        "max": round(max(values), 6),
+    }
+
+
+class Prices:
+    """Represent the prices of the tokens in USD per million tokens."""
+
+    @require(lambda prompt: prompt >= 0.0)
+    @require(lambda completion: completion >= 0.0)
+    @require(lambda cached: cached >= 0.0)
+    def __init__(self, prompt: float, completion: float, cached: float) -> None:
+        """
+        Initialize with the given values.
+
+        :param prompt: price of the uncached prompt tokens
+        :param completion: price of the completion tokens
+        :param cached: price of the prompt tokens served from the provider's cache
+        """
+        self.prompt = prompt
+        self.completion = completion
+        self.cached = cached
+
+    def compute_cost(
+        self, prompt_tokens: int, cached_tokens: int, completion_tokens: int
+    ) -> float:
+        """
+        Compute the cost of the tokens in USD.
+
+        >>> prices = Prices(prompt=2.0, completion=8.0, cached=0.5)
+        >>> prices.compute_cost(
+        ...     prompt_tokens=1500, cached_tokens=1000, completion_tokens=250
+        ... )
+        0.0035
+        """
+        return round(
+            (
+                (prompt_tokens - cached_tokens) * self.prompt
+                + cached_tokens * self.cached
+                + completion_tokens * self.completion
+            )
+            / 1e6,
+            6,
+        )
+
+
+class RequestMetrics:
+    """
+    Measure a single request to the backend.
+
+    The requests whose answers are served from the local cache are recorded as
+    well, but with no tokens nor latency.
+    """
+
+    def __init__(
+        self, batch_index: int, part_of_speech: Optional[str], follow_up: bool
+    ) -> None:
+        """
+        Initialize with the given values and zero measurements.
+
+        :param batch_index: index of the batch in the text
+        :param part_of_speech: of the prompt, or None if combined
+        :param follow_up: set if the request follows up on the invalid rows
+        """
+        self.batch_index = batch_index
+        self.part_of_speech = part_of_speech
+        self.follow_up = follow_up
+
+        #: Model which answered, or None if the request failed
+        self.model = None  # type: Optional[str]
+
+        self.cached_answer = False
+        self.attempts = 0
+
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+        #: Seconds spent waiting for the concurrency slot and the rate limiter
+        self.queue_wait = 0.0
+
+        #: Seconds spent waiting for the answers over all the attempts
+        self.latency = 0.0
+
+        #: Seconds spent parsing, validating and normalizing the answer
+        self.parse_time = 0.0
+
+        #: Number of the valid rows in the answer
+        self.row_count = 0
+
+        #: Number of the valid rows whose words have already been observed
+        self.duplicate_count = 0
+
+    def to_jsonable(self, prices: Optional[Prices]) -> Dict[str, Any]:
+        """Convert to a JSON-able mapping, including the cost if ``prices`` given."""
+        jsonable = {
+            "batch_index": self.batch_index,
+            "part_of_speech": self.part_of_speech,
+            "follow_up": self.follow_up,
+            "model": self.model,
+            "cached_answer": self.cached_answer,
+            "attempts": self.attempts,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "queue_wait": round(self.queue_wait, 6),
+            "latency": round(self.latency, 6),
+            "parse_time": round(self.parse_time, 6),
+            "row_count": self.row_count,
+            "duplicate_count": self.duplicate_count,
+        }  # type: Dict[str, Any]
+
+        if prices is not None:
+            jsonable["cost"] = prices.compute_cost(
+                prompt_tokens=self.prompt_tokens,
+                cached_tokens=self.cached_tokens,
+                completion_tokens=self.completion_tokens,
+            )
+
+        return jsonable
+
+
+class Recorder:
+    """Collect the metrics of all the requests of a run."""
+
+    def __init__(self, prices: Optional[Prices]) -> None:
+        """
+        Initialize with no records.
+
+        :param prices: if set, the cost is included in the report
+        """
+        self.prices = prices
+        self.records = []  # type: List[RequestMetrics]
+        self._start = time.perf_counter()
+
+    def start(
+        self, batch_index: int, part_of_speech: Optional[str], follow_up: bool
+    ) -> RequestMetrics:
+        """Start recording a new request."""
+        record = RequestMetrics(
+            batch_index=batch_index,
+            part_of_speech=part_of_speech,
+            follow_up=follow_up,
+        )
+        self.records.append(record)
+        return record
+
+    def summarize(self) -> Dict[str, Any]:
+        """Summarize the records with the totals and the percentiles."""
+        sent = [record for record in self.records if not record.cached_answer]
+
+        summary = {
+            "elapsed": round(time.perf_counter() - self._start, 6),
+            "request_count": len(sent),
+            "cached_answer_count": len(self.records) - len(sent),
+            "follow_up_count": sum(1 for record in self.records if record.follow_up),
+            "attempt_count": sum(record.attempts for record in sent),
+            "prompt_tokens": sum(record.prompt_tokens for record in sent),
+            "cached_tokens": sum(record.cached_tokens for record in sent),
+            "completion_tokens": sum(record.completion_tokens for record in sent),
+            "row_count": sum(record.row_count for record in self.records),
+            "duplicate_count": sum(record.duplicate_count for record in self.records),
+            "queue_wait": summarize_distribution(
+                [record.queue_wait for record in sent]
+            ),
+            "latency": summarize_distribution([record.latency for record in sent]),
+            "parse_time": summarize_distribution(
+                [record.parse_time for record in self.records]
+            ),
+            "prompt_tokens_per_request": summarize_distribution(
+                [record.prompt_tokens for record in sent]
+            ),
+            "completion_tokens_per_request": summarize_distribution(
+                [record.completion_tokens for record in sent]
+            ),
+            "rows_per_request": summarize_distribution(
+                [record.row_count for record in self.records]
+            ),
+        }  # type: Dict[str, Any]
+
+        if self.prices is not None:
+            summary["cost"] = self.prices.compute_cost(
+                prompt_tokens=summary["prompt_tokens"],
+                cached_tokens=summary["cached_tokens"],
+                completion_tokens=summary["completion_tokens"],
+            )
+
+        return summary
+
+    def write(self, path: pathlib.Path) -> None:
+        """
+        Write the report to ``path``.
+
+        If ``path`` ends with ``.jsonl``, every request is written on its own line,
+        followed by the summary on the last line. Otherwise, a single JSON document
+        with the summary and the requests is written.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        requests = [record.to_jsonable(self.prices) for record in self.records]
+        summary = self.summarize()
+
+        with path.open("wt", encoding="utf-8") as fid:
+            if path.suffix.lower() == ".jsonl":
+                for request in requests:
+                    fid.write(json.dumps({"request": request}, ensure_ascii=False))
+                    fid.write("\n")
+
+                fid.write(json.dumps({"summary": summary}, ensure_ascii=False))
+                fid.write("\n")
+            else:
+                json.dump(
+                    {"summary": summary, "requests": requests},
+                    fid,
+                    ensure_ascii=False,
+                    indent=2,
+                )
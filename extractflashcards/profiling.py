@@ -0,0 +1,161 @@
+"""Time the named stages of a run and optionally profile it with cProfile."""
+
+import cProfile
+import contextlib
+import pathlib
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, TypeVar
+
+from icontract import require
+
+T = TypeVar("T")
+
+
+class StageProfiler:
+    """
+    Sum up the wall time and the number of calls per named stage.
+
+    The stages are reported in the order in which they have been first timed.
+    The calls of an overlapping stage, *e.g.*, the concurrent requests, can add up
+    to more than the elapsed time, so their share of it is not reported.
+    If ``cprofile_path`` is given, the whole run between :py:meth:`start` and
+    :py:meth:`stop` is additionally profiled with cProfile, and the statistics
+    are dumped to it so that they can be inspected with :py:mod:`pstats`.
+
+    >>> profiler = StageProfiler(cprofile_path=None)
+    >>> with profiler.stage("splitting"):
+    ...     pass
+    >>> list(profiler.iterate("splitting", [1, 2]))
+    [1, 2]
+    >>> profiler.add("prompting", seconds=1.5, count=4)
+    >>> profiler.counts
+    {'splitting': 3, 'prompting': 4}
+    """
+
+    def __init__(self, cprofile_path: Optional[pathlib.Path]) -> None:
+        """
+        Initialize with no stages.
+
+        :param cprofile_path: if set, where to dump the cProfile statistics
+        """
+        self.cprofile_path = cprofile_path
+
+        self.seconds = dict()  # type: Dict[str, float]
+        self.counts = dict()  # type: Dict[str, int]
+        self.overlapping = set()  # type: Set[str]
+
+        self._cprofile = None  # type: Optional[cProfile.Profile]
+        self._start = None  # type: Optional[float]
+
+    @require(lambda seconds: seconds >= 0.0)
+    @require(lambda count: count >= 0)
+    def add(
+        self, name: str, seconds: float, count: int = 1, overlapping: bool = False
+    ) -> None:
+        """
+        Add the ``seconds`` spent in ``count`` calls of the stage ``name``.
+
+        If ``overlapping`` is set, the calls of the stage ran concurrently.
+        """
+        if overlapping:
+            self.overlapping.add(name)
+
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the block as a call of the stage ``name``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def iterate(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """
+        Time the production of every item of the lazy ``iterable`` as a call.
+
+        The time which the consumer spends on the items is not included.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start, count=0)
+                return
+
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def start(self) -> None:
+        """Start the clock of the run and cProfile, if requested."""
+        self._start = time.perf_counter()
+
+        if self.cprofile_path is not None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self, stream: TextIO) -> None:
+        """Stop cProfile and dump its statistics, and report the stages to ``stream``."""
+        if self._cprofile is not None:
+            assert self.cprofile_path is not None
+
+            self._cprofile.disable()
+            self.cprofile_path.parent.mkdir(parents=True, exist_ok=True)
+            self._cprofile.dump_stats(str(self.cprofile_path))
+            self._cprofile = None
+
+        elapsed = time.perf_counter() - self._start if self._start is not None else None
+
+        stream.write(self.format_report(elapsed))
+        if self.cprofile_path is not None:
+            stream.write(
+                f"Dumped the cProfile statistics to {self.cprofile_path}; "
+                f"inspect them with: python -m pstats {self.cprofile_path}\n"
+            )
+
+    def format_report(self, elapsed: Optional[float]) -> str:
+        """
+        Format the table of the stages.
+
+        >>> profiler = StageProfiler(cprofile_path=None)
+        >>> profiler.add("note insertion", seconds=0.25, count=100)
+        >>> profiler.add("TTS", seconds=12.0, count=100)
+        >>> profiler.add("prompting", seconds=50.0, count=10, overlapping=True)
+        >>> print(profiler.format_report(elapsed=12.5), end="")
+        Stage           Calls  Total [s]  Mean [s]  Share
+        note insertion    100      0.250     0.003     2%
+        TTS               100     12.000     0.120    96%
+        prompting          10     50.000     5.000
+        Elapsed                   12.500
+        """
+        width = max(
+            [len("Stage"), len("Elapsed")] + [len(name) for name in self.seconds]
+        )
+
+        lines = [
+            f"{'Stage':<{width}}  {'Calls':>5}  {'Total [s]':>9}  {'Mean [s]':>8}  "
+            f"Share"
+        ]  # type: List[str]
+
+        for name, seconds in self.seconds.items():
+            count = self.counts[name]
+            mean = f"{seconds / count:>8.3f}" if count > 0 else f"{'':>8}"
+            share = (
+                f"{seconds / elapsed:>5.0%}"
+                if elapsed is not None
+                and elapsed > 0.0
+                and name not in self.overlapping
+                else f"{'':>5}"
+            )
+            lines.append(
+                f"{name:<{width}}  {count:>5}  {seconds:>9.3f}  {mean}  {share}"
+            )
+
+        if elapsed is not None:
+            lines.append(f"{'Elapsed':<{width}}  {'':>5}  {elapsed:>9.3f}")
+
+        return "".join(line.rstrip() + "\n" for line in lines)
@@ -0,0 +1,184 @@
+"""Report the progress of a long run live on a terminal."""
+
+import collections
+import datetime
+import time
+from typing import Deque, Dict, List, Mapping, Optional, TextIO, Tuple
+
+from icontract import require
+
+
+def format_status(
+    completed: int,
+    total: Optional[float],
+    estimated: bool,
+    noun: str,
+    rates: Mapping[str, float],
+    eta: Optional[float],
+) -> str:
+    """
+    Format the status line of the progress.
+
+    >>> format_status(
+    ...     completed=120,
+    ...     total=300,
+    ...     estimated=False,
+    ...     noun="units",
+    ...     rates={"units": 1.5, "rows": 12.25},
+    ...     eta=83.4,
+    ... )
+    '120/300 units (40%), 1.5 units/s, 12.2 rows/s, ETA 0:01:23'
+    >>> format_status(
+    ...     completed=7,
+    ...     total=None,
+    ...     estimated=False,
+    ...     noun="notes",
+    ...     rates={},
+    ...     eta=None,
+    ... )
+    '7 notes'
+    """
+    parts = []  # type: List[str]
+
+    if total is None:
+        parts.append(f"{completed} {noun}")
+    else:
+        rounded_total = max(completed, round(total))
+        percentage = completed / rounded_total if rounded_total > 0 else 1.0
+        parts.append(
+            f"{completed}/{'~' if estimated else ''}{rounded_total} {noun} "
+            f"({percentage:.0%})"
+        )
+
+    for name, rate in rates.items():
+        parts.append(f"{rate:.1f} {name}/s")
+
+    if eta is not None:
+        parts.append(f"ETA {datetime.timedelta(seconds=round(eta))}")
+
+    return ", ".join(parts)
+
+
+class ProgressReporter:
+    """
+    Report the completed items, the throughput and the ETA on a terminal.
+
+    The throughput is the moving average over the last ``window`` seconds, so
+    that the ETA follows the current speed rather than the speed of the start.
+    The status line is redrawn in place at most every ``interval`` seconds.
+
+    The reporter stays silent if the ``stream`` is not a terminal, so that
+    the logs and the pipes are not cluttered.
+    """
+
+    @require(lambda interval: interval >= 0.0)
+    @require(lambda window: window > 0.0)
+    def __init__(
+        self,
+        stream: TextIO,
+        noun: str,
+        total: Optional[int] = None,
+        interval: float = 0.5,
+        window: float = 30.0,
+    ) -> None:
+        """
+        Initialize with zero completed items.
+
+        :param stream: where to draw the status line
+        :param noun: to describe the completed items
+        :param total: number of the items, if known
+        :param interval: minimum delay between two redraws in seconds
+        :param window: of the moving average of the throughput in seconds
+        """
+        self.stream = stream
+        self.noun = noun
+        self.interval = interval
+        self.window = window
+
+        self.enabled = stream.isatty()
+
+        self.total = None if total is None else float(total)
+        self.estimated = False
+
+        self.completed = 0
+        self.totals = dict()  # type: Dict[str, int]
+
+        self._samples = (
+            collections.deque()
+        )  # type: Deque[Tuple[float, int, Dict[str, int]]]
+        self._samples.append((time.monotonic(), 0, dict()))
+
+        self._last_draw = None  # type: Optional[float]
+        self._drawn = False
+
+    def set_total(self, total: float, estimated: bool) -> None:
+        """Set the number of the items, or its estimate if it is not known yet."""
+        self.total = total
+        self.estimated = estimated
+
+    def update(self, completed: int, **totals: int) -> None:
+        """
+        Update the number of the ``completed`` items and the other running totals.
+
+        The throughput of every running total is reported in addition to that of
+        the completed items.
+        """
+        if not self.enabled:
+            return
+
+        now = time.monotonic()
+
+        self.completed = completed
+        self.totals = dict(totals)
+
+        self._samples.append((now, completed, self.totals))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+        if self._last_draw is None or now - self._last_draw >= self.interval:
+            self._draw(now)
+
+    def _draw(self, now: float) -> None:
+        first_time, first_completed, first_totals = self._samples[0]
+        duration = now - first_time
+
+        rates = dict()  # type: Dict[str, float]
+        eta = None  # type: Optional[float]
+
+        if duration > 0.0:
+            completed_rate = (self.completed - first_completed) / duration
+            rates[self.noun] = completed_rate
+
+            for name, value in self.totals.items():
+                rates[name] = (value - first_totals.get(name, 0)) / duration
+
+            if self.total is not None and completed_rate > 0.0:
+                eta = max(0.0, self.total - self.completed) / completed_rate
+
+        status = format_status(
+            completed=self.completed,
+            total=self.total,
+            estimated=self.estimated,
+            noun=self.noun,
+            rates=rates,
+            eta=eta,
+        )
+
+        # NOTE (mristin):
+        # We return the carriage and erase the rest of the line so that
+        # the status line is redrawn in place.
+        self.stream.write(f"\r{status}\x1b[K")
+        self.stream.flush()
+
+        self._last_draw = now
+        self._drawn = True
+
+    def close(self) -> None:
+        """Draw the final status, if any has been drawn, and end its line."""
+        if not self._drawn:
+            return
+
+        self._draw(time.monotonic())
+        self.stream.write("\n")
+        self.stream.flush()
+        self._drawn = False
@@ -0,0 +1,188 @@
+"""Throttle the requests client-side to stay within the quotas of OpenAI."""
+
+import asyncio
+import time
+from typing import Callable, Optional
+
+from icontract import require, ensure
+
+
+class TokenBucket:
+    """
+    Refill the bucket continuously at the given rate per minute.
+
+    The bucket holds only the quota of ``burst_seconds`` so that we never send
+    a whole minute of quota at once, as the providers also enforce the quotas
+    over shorter windows.
+
+    >>> now = 0.0
+    >>> bucket = TokenBucket(rate_per_minute=600, burst_seconds=1.0, clock=lambda: now)
+    >>> bucket.capacity
+    10.0
+    >>> bucket.delay(10)
+    0.0
+    >>> bucket.debit(10)
+    >>> bucket.delay(5)
+    0.5
+    >>> now = 0.5
+    >>> bucket.delay(5)
+    0.0
+
+    The amount larger than the capacity only needs to wait for a full bucket:
+
+    >>> bucket.debit(5)
+    >>> bucket.delay(1000)
+    1.0
+    """
+
+    @require(lambda rate_per_minute: rate_per_minute > 0)
+    @require(lambda burst_seconds: burst_seconds > 0.0)
+    def __init__(
+        self,
+        rate_per_minute: float,
+        burst_seconds: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Initialize a full bucket.
+
+        :param rate_per_minute: refill rate of the bucket
+        :param burst_seconds:
+            the bucket holds the refill of this many seconds, but at least one unit
+        :param clock: monotonic clock in seconds
+        """
+        self.rate_per_minute = rate_per_minute
+        self.capacity = max(1.0, rate_per_minute * burst_seconds / 60.0)
+        self._clock = clock
+        self._level = self.capacity
+        self._last_refill = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+
+        self._level = min(
+            self.capacity, self._level + elapsed * self.rate_per_minute / 60.0
+        )
+
+    @require(lambda amount: amount >= 0)
+    @ensure(lambda result: result >= 0.0)
+    def delay(self, amount: float) -> float:
+        """
+        Compute how many seconds we need to wait before ``amount`` is available.
+
+        The ``amount`` larger than the capacity is capped to the capacity so that
+        the oversized requests can still pass through an empty bucket.
+        """
+        self._refill()
+
+        amount = min(amount, self.capacity)
+        if self._level >= amount:
+            return 0.0
+
+        return (amount - self._level) * 60.0 / self.rate_per_minute
+
+    def debit(self, amount: float) -> None:
+        """Take the ``amount`` from the bucket; the level can become negative."""
+        self._refill()
+        self._level -= amount
+
+    def credit(self, amount: float) -> None:
+        """Give the ``amount`` back to the bucket, up to its capacity."""
+        self._refill()
+        self._level = min(self.capacity, self._level + amount)
+
+
+class RateLimiter:
+    """
+    Schedule the requests within the requests-per-minute and tokens-per-minute.
+
+    >>> now = 0.0
+    >>> limiter = RateLimiter(
+    ...     requests_per_minute=60, tokens_per_minute=6000, clock=lambda: now
+    ... )
+    >>> limiter.requests.capacity, limiter.tokens.capacity
+    (2.0, 200.0)
+    >>> asyncio.run(limiter.acquire(estimated_tokens=150))
+    >>> limiter.tokens.delay(100)
+    0.5
+
+    The tokens which were estimated, but not used, are given back:
+
+    >>> limiter.correct(estimated_tokens=150, actual_tokens=100)
+    >>> limiter.tokens.delay(100)
+    0.0
+
+    The tokens used beyond the estimate are debited as well:
+
+    >>> limiter.correct(estimated_tokens=0, actual_tokens=100)
+    >>> limiter.tokens.delay(100)
+    1.0
+    """
+
+    @require(
+        lambda requests_per_minute: requests_per_minute is None
+        or requests_per_minute > 0
+    )
+    @require(
+        lambda tokens_per_minute: tokens_per_minute is None or tokens_per_minute > 0
+    )
+    def __init__(
+        self,
+        requests_per_minute: Optional[int],
+        tokens_per_minute: Optional[int],
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Initialize with the given quotas.
+
+        :param requests_per_minute: quota on requests, if any
+        :param tokens_per_minute: quota on tokens, if any
+        :param clock: monotonic clock in seconds
+        """
+        self.requests = (
+            TokenBucket(rate_per_minute=requests_per_minute, clock=clock)
+            if requests_per_minute is not None
+            else None
+        )
+
+        self.tokens = (
+            TokenBucket(rate_per_minute=tokens_per_minute, clock=clock)
+            if tokens_per_minute is not None
+            else None
+        )
+
+    @require(lambda estimated_tokens: estimated_tokens >= 0)
+    async def acquire(self, estimated_tokens: int) -> None:
+        """Wait until a request with ``estimated_tokens`` can be sent, and debit it."""
+        while True:
+            delay = 0.0
+            if self.requests is not None:
+                delay = max(delay, self.requests.delay(1))
+
+            if self.tokens is not None:
+                delay = max(delay, self.tokens.delay(estimated_tokens))
+
+            if delay == 0.0:
+                break
+
+            await asyncio.sleep(delay)
+
+        if self.requests is not None:
+            self.requests.debit(1)
+
+        if self.tokens is not None:
+            self.tokens.debit(estimated_tokens)
+
+    @require(lambda estimated_tokens: estimated_tokens >= 0)
+    @require(lambda actual_tokens: actual_tokens >= 0)
+    def correct(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the debited estimate with the actual token usage."""
+        if self.tokens is None:
+            return
+
+        if actual_tokens > estimated_tokens:
+            self.tokens.debit(actual_tokens - estimated_tokens)
+        else:
+            self.tokens.credit(estimated_tokens - actual_tokens)
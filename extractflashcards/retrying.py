@@ -0,0 +1,120 @@
+"""Retry the transient failures of the requests with exponential backoff."""
+
+import asyncio
+import random
+from typing import Awaitable, Callable, Optional, Tuple, Type, TypeVar
+
+import openai
+from icontract import require, ensure
+
+#: Exceptions which are considered transient and hence worth a retry
+RETRYABLE_EXCEPTIONS = (
+    openai.error.RateLimitError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+    openai.error.APIError,
+    asyncio.TimeoutError,
+)  # type: Tuple[Type[BaseException], ...]
+
+
+def parse_retry_after(exception: BaseException) -> Optional[float]:
+    """
+    Parse the ``Retry-After`` header of the ``exception`` in seconds, if available.
+
+    >>> parse_retry_after(openai.error.RateLimitError(headers={"Retry-After": "3"}))
+    3.0
+    >>> parse_retry_after(asyncio.TimeoutError()) is None
+    True
+    """
+    if not isinstance(exception, openai.error.OpenAIError):
+        return None
+
+    headers = exception.headers
+    if headers is None:
+        return None
+
+    for key, value in headers.items():
+        if key.lower() == "retry-after":
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return None
+
+    return None
+
+
+class RetryPolicy:
+    """Define how many times and how long we wait before we retry a request."""
+
+    @require(lambda max_attempts: max_attempts >= 1)
+    @require(lambda initial_backoff: initial_backoff > 0.0)
+    @require(lambda initial_backoff, max_backoff: initial_backoff <= max_backoff)
+    @require(lambda timeout: timeout > 0.0)
+    def __init__(
+        self,
+        max_attempts: int,
+        timeout: float,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ) -> None:
+        """
+        Initialize with the given values.
+
+        :param max_attempts: maximum number of attempts including the first one
+        :param timeout: deadline of a single attempt in seconds
+        :param initial_backoff: upper bound on the first backoff in seconds
+        :param max_backoff: upper bound on any backoff in seconds
+        """
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+    @require(lambda attempt: attempt >= 0)
+    @ensure(lambda result: result >= 0.0)
+    def compute_backoff(self, attempt: int, exception: BaseException) -> float:
+        """
+        Compute the backoff after the failed ``attempt`` with full jitter.
+
+        If the server told us when to retry, we wait at least that long.
+        """
+        ceiling = min(self.max_backoff, self.initial_backoff * (2**attempt))
+        backoff = random.uniform(0.0, ceiling)
+
+        retry_after = parse_retry_after(exception)
+        if retry_after is not None:
+            backoff = max(backoff, retry_after)
+
+        return backoff
+
+
+T = TypeVar("T")
+
+
+async def retry(
+    call: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    on_retry: Callable[[int, float, BaseException], None],
+) -> T:
+    """
+    Await the ``call`` and repeat it on the transient failures.
+
+    The ``on_retry`` is called with the failed attempt, the backoff and
+    the exception before we wait for the next attempt. The exception of the last
+    attempt is propagated.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except RETRYABLE_EXCEPTIONS as exception:
+            if attempt + 1 >= policy.max_attempts:
+                raise
+
+            backoff = policy.compute_backoff(attempt=attempt, exception=exception)
+            on_retry(attempt, backoff, exception)
+
+        await asyncio.sleep(backoff)
+        attempt += 1
@@ -0,0 +1,281 @@
+"""Route the prompts of each part of speech to their own model and parameters."""
+
+import json
+import pathlib
+from typing import Any, Collection, Dict, Mapping, Optional, Tuple
+
+from icontract import require
+
+#: Kind of the prompts which extract all the parts of speech at once
+COMBINED = "combined"
+
+
+class Route:
+    """Specify the model and the parameters for a kind of prompts."""
+
+    @require(lambda model: model != "")
+    @require(lambda max_tokens: max_tokens is None or max_tokens > 0)
+    @require(lambda temperature: temperature is None or 0.0 <= temperature <= 2.0)
+    @require(lambda fallback_model: fallback_model is None or fallback_model != "")
+    def __init__(
+        self,
+        model: str,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        fallback_model: Optional[str] = None,
+    ) -> None:
+        """
+        Initialize with the given values.
+
+        :param model: to complete the prompts with
+        :param max_tokens: upper bound on the tokens of an answer, if any
+        :param temperature: of the sampling, if not the default of the provider
+        :param fallback_model: to complete the prompts with if ``model`` fails
+        """
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.fallback_model = fallback_model
+
+    @property
+    def models(self) -> Tuple[str, ...]:
+        """
+        List the models to try in order.
+
+        >>> Route("gpt-3.5-turbo", fallback_model="gpt-4-turbo-preview").models
+        ('gpt-3.5-turbo', 'gpt-4-turbo-preview')
+        >>> Route("gpt-4-turbo-preview", fallback_model="gpt-4-turbo-preview").models
+        ('gpt-4-turbo-preview',)
+        """
+        if self.fallback_model is None or self.fallback_model == self.model:
+            return (self.model,)
+
+        return self.model, self.fallback_model
+
+    @property
+    def parameters(self) -> Dict[str, Any]:
+        """
+        Collect the completion parameters which differ from the provider's defaults.
+
+        >>> Route("gpt-3.5-turbo", max_tokens=512).parameters
+        {'max_tokens': 512}
+        """
+        parameters = dict()  # type: Dict[str, Any]
+        if self.max_tokens is not None:
+            parameters["max_tokens"] = self.max_tokens
+
+        if self.temperature is not None:
+            parameters["temperature"] = self.temperature
+
+        return parameters
+
+    def __str__(self) -> str:
+        """
+        Describe the route for the reports.
+
+        >>> print(Route("gpt-3.5-turbo", max_tokens=512, fallback_model="gpt-4"))
+        gpt-3.5-turbo (max_tokens=512, falling back to gpt-4)
+        """
+        details = [f"{key}={value}" for key, value in self.parameters.items()]
+        if self.fallback_model is not None:
+            details.append(f"falling back to {self.fallback_model}")
+
+        if len(details) == 0:
+            return self.model
+
+        return f"{self.model} ({', '.join(details)})"
+
+
+def override(
+    base: Route, values: Mapping[str, Any]
+) -> Tuple[Optional[Route], Optional[str]]:
+    """
+    Override the settings of the ``base`` route with the ``values``.
+
+    The values can be given either as strings, as on the command line, or already
+    typed, as in a JSON file.
+
+    Return the new route, or an error, if any.
+
+    >>> route, _ = override(Route("gpt-4-turbo-preview"), {"max_tokens": "512"})
+    >>> print(route)
+    gpt-4-turbo-preview (max_tokens=512)
+    >>> _, error = override(Route("gpt-4-turbo-preview"), {"top_p": "0.5"})
+    >>> error
+    "Unexpected setting 'top_p', expected one of: model, max_tokens, temperature, fallback_model"
+    """
+    settings = {
+        "model": base.model,
+        "max_tokens": base.max_tokens,
+        "temperature": base.temperature,
+        "fallback_model": base.fallback_model,
+    }  # type: Dict[str, Any]
+
+    for key, value in values.items():
+        if key not in settings:
+            return None, (
+                f"Unexpected setting {key!r}, expected one of: "
+                f"{', '.join(settings)}"
+            )
+
+        if key in ("model", "fallback_model"):
+            if not isinstance(value, str) or value.strip() == "":
+                return None, f"Expected a non-empty string for {key}, got: {value!r}"
+
+            settings[key] = value.strip()
+
+        elif key == "max_tokens":
+            try:
+                max_tokens = int(value)
+            except (TypeError, ValueError):
+                return None, f"Expected an integer for max_tokens, got: {value!r}"
+
+            if max_tokens <= 0:
+                return None, f"Expected a positive max_tokens, got: {max_tokens}"
+
+            settings[key] = max_tokens
+
+        elif key == "temperature":
+            try:
+                temperature = float(value)
+            except (TypeError, ValueError):
+                return None, f"Expected a number for temperature, got: {value!r}"
+
+            if not 0.0 <= temperature <= 2.0:
+                return None, f"Expected temperature in [0, 2], got: {temperature}"
+
+            settings[key] = temperature
+
+        else:
+            raise AssertionError(f"Unhandled setting: {key}")
+
+    return Route(**settings), None
+
+
+def parse_route(
+    text: str, base: Route, kinds: Collection[str]
+) -> Tuple[Optional[Tuple[str, Route]], Optional[str]]:
+    """
+    Parse the route from the command line in the form ``KIND:MODEL[,KEY=VALUE...]``.
+
+    The settings which are not given are taken from the ``base`` route.
+
+    Return the kind of the prompts and its route, or an error, if any.
+
+    >>> (kind, route), _ = parse_route(
+    ...     "adverb:gpt-3.5-turbo,max_tokens=512,temperature=0",
+    ...     base=Route("gpt-4-turbo-preview", fallback_model="gpt-4"),
+    ...     kinds=["noun", "adverb"],
+    ... )
+    >>> kind, str(route)
+    ('adverb', 'gpt-3.5-turbo (max_tokens=512, temperature=0.0, falling back to gpt-4)')
+    >>> _, error = parse_route("pronoun:gpt-3.5-turbo", Route("gpt-4"), ["noun"])
+    >>> error
+    "Unexpected kind of prompts 'pronoun', expected one of: noun"
+    """
+    kind, colon, rest = text.partition(":")
+    kind = kind.strip()
+
+    if colon == "" or rest.strip() == "":
+        return None, f"Expected KIND:MODEL[,KEY=VALUE...], but got: {text!r}"
+
+    if kind not in kinds:
+        return None, (
+            f"Unexpected kind of prompts {kind!r}, expected one of: "
+            f"{', '.join(kinds)}"
+        )
+
+    model, *assignments = rest.split(",")
+
+    values = {"model": model}  # type: Dict[str, Any]
+    for assignment in assignments:
+        key, equals, value = assignment.partition("=")
+        if equals == "":
+            return None, f"Expected KEY=VALUE in {text!r}, but got: {assignment!r}"
+
+        values[key.strip()] = value.strip()
+
+    route, error = override(base, values)
+    if error is not None:
+        return None, f"Invalid route {text!r}: {error}"
+
+    assert route is not None
+    return (kind, route), None
+
+
+def load(
+    path: pathlib.Path, base: Route, kinds: Collection[str]
+) -> Tuple[Optional[Dict[str, Route]], Optional[str]]:
+    """
+    Load the routes from the JSON file which maps the kinds of prompts to settings.
+
+    For example:
+
+    .. code-block:: json
+
+        {
+            "adverb": {"model": "gpt-3.5-turbo", "max_tokens": 1024},
+            "noun": {"temperature": 0.2}
+        }
+
+    The settings which are not given are taken from the ``base`` route.
+
+    Return the routes by the kinds of prompts, or an error, if any.
+    """
+    try:
+        mapping = json.loads(path.read_text(encoding="utf-8"))
+    except Exception as exception:
+        return None, f"Failed to read the routes from {path}: {exception}"
+
+    if not isinstance(mapping, dict):
+        return None, f"Expected a JSON object in {path}, but got: {type(mapping)}"
+
+    routes = dict()  # type: Dict[str, Route]
+    for kind, values in mapping.items():
+        if kind not in kinds:
+            return None, (
+                f"Unexpected kind of prompts {kind!r} in {path}, expected one of: "
+                f"{', '.join(kinds)}"
+            )
+
+        if not isinstance(values, dict):
+            return None, (
+                f"Expected a JSON object for {kind!r} in {path}, "
+                f"but got: {type(values)}"
+            )
+
+        route, error = override(base, values)
+        if error is not None:
+            return None, f"Invalid route for {kind!r} in {path}: {error}"
+
+        assert route is not None
+        routes[kind] = route
+
+    return routes, None
+
+
+class RoutingTable:
+    """Map the kinds of prompts to their routes."""
+
+    def __init__(self, default: Route, routes: Mapping[str, Route]) -> None:
+        """
+        Initialize with the given values.
+
+        :param default: route of the kinds of prompts not in ``routes``
+        :param routes: routes by the kinds of prompts
+        """
+        self.default = default
+        self.routes = routes
+
+    def route(self, kind: Optional[str]) -> Route:
+        """
+        Find the route of the ``kind`` of prompts, or of the combined ones if None.
+
+        >>> table = RoutingTable(
+        ...     default=Route("gpt-4-turbo-preview"),
+        ...     routes={"adverb": Route("gpt-3.5-turbo")},
+        ... )
+        >>> table.route("adverb").model, table.route(None).model
+        ('gpt-3.5-turbo', 'gpt-4-turbo-preview')
+        """
+        return self.routes.get(kind if kind is not None else COMBINED, self.default)
@@ -0,0 +1,553 @@
+"""Write the extracted flash cards in different output formats."""
+
+import abc
+import csv
+import enum
+import gzip
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from icontract import require
+
+
+class OutputFormat(enum.Enum):
+    """Enumerate the supported output formats."""
+
+    CSV = "csv"
+    CSV_GZIP = "csv.gz"
+    CSV_ZSTD = "csv.zst"
+    JSONL = "jsonl"
+    PARQUET = "parquet"
+    SQLITE = "sqlite"
+
+
+#: Output formats which can be written to STDOUT
+TEXT_FORMATS = {OutputFormat.CSV, OutputFormat.JSONL}
+
+#: Output formats which can be appended to when an interrupted run resumes
+APPENDABLE_FORMATS = {OutputFormat.CSV, OutputFormat.JSONL, OutputFormat.SQLITE}
+
+#: Name the five columns of the rows passed on to the sinks
+COLUMNS = ["word", "translation", "phrase", "phrase_translation", "part_of_speech"]
+
+
+class Sink(abc.ABC):
+    """
+    Write the five-column rows of the extracted flash cards.
+
+    The columns are given in :py:data:`COLUMNS`. The part of speech is empty if
+    unknown.
+    """
+
+    @abc.abstractmethod
+    def write(self, rows: Sequence[Sequence[str]]) -> None:
+        """Write the ``rows``."""
+        raise NotImplementedError()
+
+    #: Set if the rows are durable after :py:meth:`flush`, and not only after
+    #: :py:meth:`close`
+    durable_flush = True
+
+    @abc.abstractmethod
+    def flush(self) -> None:
+        """Make the written rows durable as far as the format allows."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """Flush the rows and close the underlying resources."""
+        raise NotImplementedError()
+
+
+class CsvSink(Sink):
+    """
+    Write the rows as CSV without the part of speech so that csv-to-anki can read it.
+
+    The rows start with a header with the languages.
+    """
+
+    def __init__(
+        self,
+        fid: TextIO,
+        source_language: str,
+        target_language: str,
+        append: bool,
+        owns_fid: bool,
+        sync: bool,
+    ) -> None:
+        """
+        Initialize with the given values.
+
+        :param fid: where to write the CSV
+        :param source_language: of the text
+        :param target_language: of the translations
+        :param append: if set, the header has already been written
+        :param owns_fid: if set, close the ``fid`` on :py:meth:`close`
+        :param sync: if set, sync the ``fid`` to the disk on :py:meth:`flush`
+        """
+        self._fid = fid
+        self._owns_fid = owns_fid
+        self._sync = sync
+        self._writer = csv.writer(fid)
+
+        if not append:
+            self._writer.writerow(
+                [
+                    source_language,
+                    target_language,
+                    f"Phrase in {source_language}",
+                    f"Phrase in {target_language}",
+                ]
+            )
+
+    def write(self, rows: Sequence[Sequence[str]]) -> None:
+        """Write the ``rows``."""
+        self._writer.writerows(row[:4] for row in rows)
+
+    def flush(self) -> None:
+        """Flush the underlying stream, and sync it to the disk if requested."""
+        self._fid.flush()
+        if self._sync:
+            os.fsync(self._fid.fileno())
+
+    def close(self) -> None:
+        """Flush and close the underlying stream if we own it."""
+        self._fid.flush()
+        if self._owns_fid:
+            self._fid.close()
+
+
+class JsonlSink(Sink):
+    """Write every row as a self-contained JSON object on a separate line."""
+
+    def __init__(
+        self,
+        fid: TextIO,
+        source_language: str,
+        target_language: str,
+        owns_fid: bool,
+        sync: bool,
+    ) -> None:
+        """
+        Initialize with the given values.
+
+        :param fid: where to write the JSON lines
+        :param source_language: of the text
+        :param target_language: of the translations
+        :param owns_fid: if set, close the ``fid`` on :py:meth:`close`
+        :param sync: if set, sync the ``fid`` to the disk on :py:meth:`flush`
+        """
+        self._fid = fid
+        self._owns_fid = owns_fid
+        self._sync = sync
+        self.source_language = source_language
+        self.target_language = target_language
+
+    def write(self, rows: Sequence[Sequence[str]]) -> None:
+        """Write the ``rows``."""
+        for row in rows:
+            record = {
+                "source_language": self.source_language,
+                "target_language": self.target_language,
+            }  # type: Dict[str, Optional[str]]
+
+            for column, value in zip(COLUMNS, row):
+                record[column] = value
+
+            if record.get("part_of_speech", "") == "":
+                record["part_of_speech"] = None
+
+            self._fid.write(json.dumps(record, ensure_ascii=False))
+            self._fid.write("\n")
+
+    def flush(self) -> None:
+        """Flush the underlying stream, and sync it to the disk if requested."""
+        self._fid.flush()
+        if self._sync:
+            os.fsync(self._fid.fileno())
+
+    def close(self) -> None:
+        """Flush and close the underlying stream if we own it."""
+        self._fid.flush()
+        if self._owns_fid:
+            self._fid.close()
+
+
+class SqliteSink(Sink):
+    """Write the rows to an SQLite table indexed by the word and part of speech."""
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        source_language: str,
+        target_language: str,
+        append: bool,
+    ) -> None:
+        """
+        Open the database.
+
+        :param path: to the SQLite database
+        :param source_language: of the text
+        :param target_language: of the translations
+        :param append: if not set, the existing database is replaced
+        """
+        if not append and path.exists():
+            path.unlink()
+
+        # NOTE (mristin):
+        # The sink is handed over to the writer thread, but it is never used
+        # concurrently.
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            "key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cards ("
+            "id INTEGER PRIMARY KEY, "
+            "word TEXT NOT NULL, "
+            "translation TEXT NOT NULL, "
+            "phrase TEXT NOT NULL, "
+            "phrase_translation TEXT NOT NULL, "
+            "part_of_speech TEXT)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS cards_word_part_of_speech "
+            "ON cards(word, part_of_speech)"
+        )
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO metadata(key, value) VALUES (?, ?)",
+            [
+                ("source_language", source_language),
+                ("target_language", target_language),
+            ],
+        )
+        self._connection.commit()
+
+    def write(self, rows: Sequence[Sequence[str]]) -> None:
+        """Write the ``rows`` in the current transaction."""
+        self._connection.executemany(
+            "INSERT INTO cards("
+            "word, translation, phrase, phrase_translation, part_of_speech"
+            ") VALUES (?, ?, ?, ?, ?)",
+            (
+                (row[0], row[1], row[2], row[3], row[4] if row[4] != "" else None)
+                for row in rows
+            ),
+        )
+
+    def flush(self) -> None:
+        """Commit the current transaction."""
+        self._connection.commit()
+
+    def close(self) -> None:
+        """Commit and close the database."""
+        self._connection.commit()
+        self._connection.close()
+
+
+class ParquetSink(Sink):
+    """
+    Write the rows to a Parquet file in row groups.
+
+    The languages are stored in the metadata of the schema. As Parquet files can
+    not be appended to, :py:meth:`flush` does not write anything and the rows
+    are only written in full row groups and on :py:meth:`close`. The rows are
+    hence durable only after :py:meth:`close`.
+    """
+
+    durable_flush = False
+
+    @require(lambda row_group_size: row_group_size > 0)
+    def __init__(
+        self,
+        path: pathlib.Path,
+        source_language: str,
+        target_language: str,
+        row_group_size: int = 65536,
+    ) -> None:
+        """
+        Open the Parquet writer.
+
+        :param path: to the Parquet file
+        :param source_language: of the text
+        :param target_language: of the translations
+        :param row_group_size: number of rows buffered before they are written
+        """
+        # pylint: disable=import-outside-toplevel,import-error
+        import pyarrow
+        import pyarrow.parquet
+
+        # pylint: enable=import-outside-toplevel,import-error
+
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema(
+            [
+                pyarrow.field(
+                    column, pyarrow.string(), nullable=(column == "part_of_speech")
+                )
+                for column in COLUMNS
+            ],
+            metadata={
+                "source_language": source_language,
+                "target_language": target_language,
+            },
+        )
+        self._writer = pyarrow.parquet.ParquetWriter(str(path), self._schema)
+        self._row_group_size = row_group_size
+        self._buffer = []  # type: List[Sequence[str]]
+
+    def _write_buffer(self) -> None:
+        if len(self._buffer) == 0:
+            return
+
+        columns = [
+            [row[i] for row in self._buffer] for i in range(len(COLUMNS) - 1)
+        ]  # type: List[List[Any]]
+        columns.append([row[4] if row[4] != "" else None for row in self._buffer])
+
+        self._writer.write_table(
+            self._pyarrow.Table.from_arrays(
+                [
+                    self._pyarrow.array(column, type=self._pyarrow.string())
+                    for column in columns
+                ],
+                schema=self._schema,
+            )
+        )
+        self._buffer = []
+
+    def write(self, rows: Sequence[Sequence[str]]) -> None:
+        """Buffer the ``rows`` and write them once a row group is full."""
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self._row_group_size:
+            self._write_buffer()
+
+    def flush(self) -> None:
+        """Do nothing as the Parquet files can only be written as a whole."""
+
+    def close(self) -> None:
+        """Write the remaining rows and the footer; closing twice is a no-op."""
+        self._write_buffer()
+        self._writer.close()
+
+
+def truncate_partial_line(path: pathlib.Path) -> None:
+    """
+    Truncate the text output at ``path`` after its last complete line.
+
+    The buffered writes might have been interrupted in the middle of a line by
+    a crash. If we appended to such an output, the next record would be glued to
+    the partial line.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     path = pathlib.Path(tmp_dir) / "out.csv"
+    ...     _ = path.write_bytes("кот,cat\\nдом,ho".encode("utf-8"))
+    ...     truncate_partial_line(path)
+    ...     path.read_text(encoding="utf-8")
+    'кот,cat\\n'
+    """
+    with path.open("r+b") as fid:
+        end = fid.seek(0, 2)
+
+        position = end
+        while position > 0:
+            start = max(0, position - 4096)
+            fid.seek(start)
+            chunk = fid.read(position - start)
+
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                position = start + newline + 1
+                break
+
+            position = start
+
+        if position < end:
+            fid.truncate(position)
+
+
+def open_sink(
+    output_format: OutputFormat,
+    path: Optional[pathlib.Path],
+    source_language: str,
+    target_language: str,
+    append: bool,
+) -> Tuple[Optional[Sink], Optional[str]]:
+    """
+    Open the sink of the ``output_format``.
+
+    :param output_format: of the output
+    :param path: to the output, or None to write to STDOUT
+    :param source_language: of the text
+    :param target_language: of the translations
+    :param append:
+        if set, continue the existing output of an interrupted run; the text
+        outputs need to be truncated with :py:func:`truncate_partial_line` first
+    :return: the sink, or an error, if any
+    """
+    if path is None:
+        if output_format is OutputFormat.CSV:
+            return (
+                CsvSink(
+                    fid=sys.stdout,
+                    source_language=source_language,
+                    target_language=target_language,
+                    append=append,
+                    owns_fid=False,
+                    sync=False,
+                ),
+                None,
+            )
+        elif output_format is OutputFormat.JSONL:
+            return (
+                JsonlSink(
+                    fid=sys.stdout,
+                    source_language=source_language,
+                    target_language=target_language,
+                    owns_fid=False,
+                    sync=False,
+                ),
+                None,
+            )
+
+        return None, f"The output format {output_format.value} can not go to STDOUT."
+
+    if append and output_format not in APPENDABLE_FORMATS:
+        return None, f"The output format {output_format.value} can not be appended to."
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # pylint: disable=consider-using-with
+    if output_format is OutputFormat.CSV:
+        return (
+            CsvSink(
+                fid=path.open("at" if append else "wt", encoding="utf-8"),
+                source_language=source_language,
+                target_language=target_language,
+                append=append and path.stat().st_size > 0,
+                owns_fid=True,
+                sync=True,
+            ),
+            None,
+        )
+    elif output_format is OutputFormat.CSV_GZIP:
+        return (
+            CsvSink(
+                fid=gzip.open(path, "wt", encoding="utf-8"),
+                source_language=source_language,
+                target_language=target_language,
+                append=False,
+                owns_fid=True,
+                sync=False,
+            ),
+            None,
+        )
+    elif output_format is OutputFormat.CSV_ZSTD:
+        try:
+            import zstandard  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            return None, (
+                "The zstandard package is needed for the output format "
+                f"{output_format.value}; install extract-flash-cards[zstd]."
+            )
+
+        return (
+            CsvSink(
+                fid=zstandard.open(path, "wt", encoding="utf-8"),
+                source_language=source_language,
+                target_language=target_language,
+                append=False,
+                owns_fid=True,
+                sync=False,
+            ),
+            None,
+        )
+    elif output_format is OutputFormat.JSONL:
+        return (
+            JsonlSink(
+                fid=path.open("at" if append else "wt", encoding="utf-8"),
+                source_language=source_language,
+                target_language=target_language,
+                owns_fid=True,
+                sync=True,
+            ),
+            None,
+        )
+    elif output_format is OutputFormat.SQLITE:
+        return (
+            SqliteSink(
+                path=path,
+                source_language=source_language,
+                target_language=target_language,
+                append=append,
+            ),
+            None,
+        )
+    elif output_format is OutputFormat.PARQUET:
+        try:
+            # pylint: disable=import-outside-toplevel,unused-import,import-error
+            import pyarrow
+
+            # pylint: enable=import-outside-toplevel,unused-import,import-error
+        except ImportError:
+            return None, (
+                "The pyarrow package is needed for the output format "
+                f"{output_format.value}; install extract-flash-cards[parquet]."
+            )
+
+        return (
+            ParquetSink(
+                path=path,
+                source_language=source_language,
+                target_language=target_language,
+            ),
+            None,
+        )
+    # pylint: enable=consider-using-with
+
+    raise AssertionError(f"Unexpected output format: {output_format}")
+
+
+def iterate_words(path: pathlib.Path, output_format: OutputFormat) -> Iterator[str]:
+    """
+    Iterate over the words already written to the output at ``path``.
+
+    The invalid records, *e.g.*, a line truncated by a crash, are skipped.
+    """
+    if output_format is OutputFormat.CSV:
+        with path.open("rt", encoding="utf-8") as fid:
+            for i, row in enumerate(csv.reader(fid)):
+                if i > 0 and len(row) > 0:
+                    yield row[0]
+
+    elif output_format is OutputFormat.JSONL:
+        with path.open("rt", encoding="utf-8") as fid:
+            for line in fid:
+                try:
+                    word = json.loads(line)["word"]
+                except Exception:
+                    continue
+
+                if isinstance(word, str):
+                    yield word
+
+    elif output_format is OutputFormat.SQLITE:
+        connection = sqlite3.connect(str(path))
+        try:
+            for (word,) in connection.execute("SELECT word FROM cards"):
+                assert isinstance(word, str)
+                yield word
+        finally:
+            connection.close()
+
+    else:
+        raise AssertionError(
+            f"Unexpected output format for reading back: {output_format}"
+        )
@@ -0,0 +1,54 @@
+"""Parse the CSV rows incrementally as the streamed completion arrives."""
+
+from typing import List
+
+from extractflashcards import validation
+
+
+class IncrementalCsvParser:
+    """
+    Accumulate the text chunks and emit the CSV rows as soon as they are complete.
+
+    A row is complete once we encounter a line break. As the answers never contain
+    line breaks within the values, we parse every line on its own so that
+    an unbalanced quote does not swallow the following rows.
+
+    >>> parser = IncrementalCsvParser()
+    >>> parser.feed('дом,house,"Дом, ')
+    []
+    >>> parser.feed('милый дом",Home\\nкот,')
+    [['дом', 'house', 'Дом, милый дом', 'Home']]
+    >>> parser.feed('cat')
+    []
+    >>> parser.finish()
+    [['кот', 'cat']]
+    """
+
+    def __init__(self) -> None:
+        """Initialize with an empty buffer."""
+        self._buffer = []  # type: List[str]
+
+    def feed(self, chunk: str) -> List[List[str]]:
+        """Feed the ``chunk`` of text and return the rows completed by it."""
+        end = chunk.rfind("\n")
+        if end == -1:
+            self._buffer.append(chunk)
+            return []
+
+        self._buffer.append(chunk[: end + 1])
+        rows = self._parse_buffer()
+
+        if end + 1 < len(chunk):
+            self._buffer.append(chunk[end + 1 :])
+
+        return rows
+
+    def finish(self) -> List[List[str]]:
+        """Parse the remainder of the text which is not terminated by a new line."""
+        return self._parse_buffer()
+
+    def _parse_buffer(self) -> List[List[str]]:
+        text = "".join(self._buffer)
+        self._buffer = []
+
+        return validation.parse_lines(text)
@@ -0,0 +1,81 @@
+"""Count the tokens of the prompts offline."""
+
+import math
+import unicodedata
+from typing import Callable
+
+#: Count the tokens in a text
+TokenCounter = Callable[[str], int]
+
+
+def _tokens_per_character(character: str) -> float:
+    """
+    Estimate how many tokens a ``character`` costs on average.
+
+    The ratios have been calibrated on the cl100k tokenizer of GPT-4. The Latin
+    script packs about four characters in a token, while Cyrillic, Greek and
+    similar scripts pack only two to three. The CJK ideographs take at least one
+    token each.
+    """
+    code_point = ord(character)
+
+    if code_point < 0x80:
+        return 0.25
+
+    if 0x0370 <= code_point < 0x0600:
+        # Greek, Cyrillic, Armenian and Hebrew
+        return 0.4
+
+    if 0x0600 <= code_point < 0x0800:
+        # Arabic and Syriac
+        return 0.45
+
+    if (
+        0x3040 <= code_point < 0x3100
+        or 0x4E00 <= code_point < 0xA000
+        or 0xAC00 <= code_point < 0xD7B0
+    ):
+        # Kana, CJK ideographs and Hangul
+        return 1.1
+
+    if unicodedata.category(character).startswith("L"):
+        return 0.5
+
+    return 0.35
+
+
+def estimate_token_count(text: str) -> int:
+    """
+    Estimate the number of tokens in the ``text`` based on its scripts.
+
+    >>> estimate_token_count("")
+    0
+    >>> estimate_token_count("hello world!")
+    3
+    >>> estimate_token_count("привет, мир!")
+    5
+    """
+    return math.ceil(sum(_tokens_per_character(character) for character in text))
+
+
+def make_token_counter(model: str) -> TokenCounter:
+    """
+    Make the token counter for the ``model``.
+
+    If ``tiktoken`` is installed, the tokens are counted exactly. Otherwise, we
+    fall back to :py:func:`estimate_token_count`.
+    """
+    try:
+        import tiktoken  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return estimate_token_count
+
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return count_tokens
@@ -0,0 +1,293 @@
+"""Validate and repair the CSV answers of ChatGPT against the text lines."""
+
+import csv
+import os
+import unicodedata
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+from icontract import require
+
+from extractflashcards import vocabulary
+
+
+def parse_lines(text: str) -> List[List[str]]:
+    """
+    Parse every line of the CSV ``text`` on its own, skipping the empty rows.
+
+    The answers never contain line breaks within the values, so an unbalanced
+    quote can not swallow the following rows. The spaces before the quotes are
+    skipped so that such values are still recognized as quoted.
+
+    >>> parse_lines('дом,house, "Дом, милый дом",Home\\n"кот,cat\\n\\nпёс,dog')
+    [['дом', 'house', 'Дом, милый дом', 'Home'], ['кот,cat'], ['пёс', 'dog']]
+    """
+    rows = []  # type: List[List[str]]
+    for line in text.splitlines():
+        for row in csv.reader([line], skipinitialspace=True):
+            if len(row) > 0:
+                rows.append(row)
+
+    return rows
+
+
+def canonicalize(text: str) -> str:
+    """
+    Canonicalize the ``text`` so that we can compare the phrases robustly.
+
+    The white space, the letter case and the surrounding quotes are ignored.
+
+    >>> canonicalize(' «Дом,  милый дом» ')
+    'дом,милыйдом'
+    """
+    return (
+        "".join(unicodedata.normalize("NFC", text).split()).casefold().strip("\"'«»“”„")
+    )
+
+
+def word_occurs(word: str, line: str) -> bool:
+    """
+    Check that every word of ``word`` occurs in the ``line``, up to the inflection.
+
+    Since the words are given in their dictionary form, we only require that each
+    shares at least the first three letters with a word of the line. This is
+    a heuristic: the irregular forms are not recognized, so the check only
+    flags the rows for the statistics and never discards them.
+
+    >>> word_occurs("читать", "Он читает книгу.")
+    True
+    >>> word_occurs("писать", "Он читает книгу.")
+    False
+    >>> word_occurs("дом", "До свидания.")
+    False
+    >>> word_occurs("идти", "Он шёл домой.")
+    False
+    """
+    line_tokens = vocabulary.tokenize(line)
+
+    word_tokens = vocabulary.tokenize(word)
+    if len(word_tokens) == 0:
+        return False
+
+    for word_token in word_tokens:
+        if not any(
+            len(os.path.commonprefix([word_token, line_token]))
+            >= min(3, len(word_token))
+            for line_token in line_tokens
+        ):
+            return False
+
+    return True
+
+
+class AnswerValidator:
+    """
+    Validate the rows of the answers to a batch and repair them where possible.
+
+    A valid row has the word, its translation, a line of the batch and
+    the translation of the line, optionally followed by the part of speech.
+    The rows are repaired locally if:
+
+    * the values are padded with white space,
+    * the commas in the values were not quoted, but the line can still be
+      recognized among the values,
+    * only a fragment of the line has been quoted, or
+    * a part of speech has been appended where none was expected.
+
+    The rows which can not be repaired are discarded, and their lines are
+    remembered so that they can be requested again. The rows whose word can not
+    be found in their line (see :py:func:`word_occurs`) are kept, but counted in
+    :py:attr:`unmatched_count`, as the word might be an irregular form.
+
+    >>> validator = AnswerValidator(
+    ...     batch="Дом, милый дом.\\nКот спит.\\n",
+    ...     with_part_of_speech=False,
+    ...     parts_of_speech=["noun"],
+    ... )
+    >>> validator.check([
+    ...     ["дом", "house", "Дом", "милый дом.", "Home", "sweet home."],
+    ...     ["кот", "cat", "Кот крепко спит.", "The cat sleeps soundly."],
+    ... ])
+    [['дом', 'house', 'Дом, милый дом.', 'Home, sweet home.']]
+    >>> validator.repaired_count, validator.invalid_count
+    (1, 1)
+    >>> validator.failed_lines
+    ['Кот спит.\\n']
+
+    >>> validator = AnswerValidator(
+    ...     batch="Дети спят.\\n", with_part_of_speech=False, parts_of_speech=[]
+    ... )
+    >>> validator.check([["ребёнок", "child", "Дети спят.", "Children sleep."]])
+    [['ребёнок', 'child', 'Дети спят.', 'Children sleep.']]
+    >>> validator.unmatched_count, validator.invalid_count
+    (1, 0)
+    """
+
+    def __init__(
+        self,
+        batch: str,
+        with_part_of_speech: bool,
+        parts_of_speech: Collection[str],
+    ) -> None:
+        """
+        Initialize for the given batch.
+
+        :param batch: text lines which have been sent in the prompt
+        :param with_part_of_speech:
+            if set, the part of speech is expected in the fifth column
+        :param parts_of_speech: valid values of the part of speech
+        """
+        self.with_part_of_speech = with_part_of_speech
+        self.parts_of_speech = {canonicalize(value) for value in parts_of_speech}
+
+        self._lines = []  # type: List[str]
+        self._line_by_canonical = dict()  # type: Dict[str, str]
+        for line in batch.splitlines():
+            stripped = line.strip()
+            if stripped == "":
+                continue
+
+            self._lines.append(stripped)
+            self._line_by_canonical.setdefault(canonicalize(stripped), stripped)
+
+        self.repaired_count = 0
+        self.invalid_count = 0
+        self.unattributed_count = 0
+        self.unmatched_count = 0
+
+        # NOTE (mristin):
+        # We use a dictionary as an ordered set.
+        self._failed = dict()  # type: Dict[str, None]
+
+    @property
+    def failed_lines(self) -> List[str]:
+        """List the lines of the invalid rows in the order of the batch."""
+        return [line + "\n" for line in self._lines if line in self._failed]
+
+    def check(self, rows: Iterable[List[str]]) -> List[List[str]]:
+        """Validate and repair the ``rows``, and return only the valid ones."""
+        result = []  # type: List[List[str]]
+        for row in rows:
+            checked = self._check_row(row)
+            if checked is not None:
+                result.append(checked)
+
+        return result
+
+    def _match_line(self, phrase: str, allow_fragment: bool) -> Optional[str]:
+        """Find the line of the batch quoted by the ``phrase``."""
+        canonical = canonicalize(phrase)
+        if canonical == "":
+            return None
+
+        line = self._line_by_canonical.get(canonical, None)
+        if line is not None or not allow_fragment:
+            return line
+
+        # NOTE (mristin):
+        # We only accept fragments which unambiguously point to a single line.
+        candidates = [
+            line
+            for canonical_line, line in self._line_by_canonical.items()
+            if canonical in canonical_line
+        ]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _resplit(self, cells: List[str]) -> Optional[Tuple[str, str, str]]:
+        """Find the line among the ``cells`` split at the unquoted commas."""
+        for start in range(2, len(cells) - 1):
+            for end in range(start + 1, len(cells)):
+                line = self._match_line(",".join(cells[start:end]), False)
+                if line is not None:
+                    return ", ".join(cells[1:start]), line, ", ".join(cells[end:])
+
+        return None
+
+    def _fail(self, row: List[str], line: Optional[str]) -> None:
+        """Discard the ``row`` and remember its ``line`` to be requested again."""
+        self.invalid_count += 1
+
+        if line is None:
+            # NOTE (mristin):
+            # We attribute the row to the line with which it shares most words.
+            row_tokens = set(vocabulary.tokenize(" ".join(row)))
+
+            best_overlap = 0
+            for candidate in self._lines:
+                overlap = len(row_tokens.intersection(vocabulary.tokenize(candidate)))
+                if overlap > best_overlap:
+                    best_overlap = overlap
+                    line = candidate
+
+        if line is None:
+            self.unattributed_count += 1
+            return
+
+        self._failed[line] = None
+
+    def _check_row(self, row: List[str]) -> Optional[List[str]]:
+        cells = [cell.strip() for cell in row]
+        if all(cell == "" for cell in cells):
+            return None
+
+        repaired = False
+
+        part_of_speech = None  # type: Optional[str]
+        if len(cells) > 4 and canonicalize(cells[-1]) in self.parts_of_speech:
+            part_of_speech = cells[-1]
+            cells = cells[:-1]
+
+            if not self.with_part_of_speech:
+                repaired = True
+
+        if len(cells) < 4 or cells[0] == "":
+            self._fail(row, None)
+            return None
+
+        if len(cells) == 4:
+            translation, phrase_translation = cells[1], cells[3]
+            line = self._match_line(cells[2], True)
+            if line is None:
+                self._fail(row, None)
+                return None
+
+            if line != cells[2]:
+                repaired = True
+        else:
+            resplit = self._resplit(cells)
+            if resplit is None:
+                self._fail(row, None)
+                return None
+
+            translation, line, phrase_translation = resplit
+            repaired = True
+
+        if not word_occurs(cells[0], line):
+            self.unmatched_count += 1
+
+        if repaired:
+            self.repaired_count += 1
+
+        result = [cells[0], translation, line, phrase_translation]
+        if self.with_part_of_speech and part_of_speech is not None:
+            result.append(part_of_speech)
+
+        return result
+
+
+class Statistics:
+    """Sum up the validation over all the answers."""
+
+    def __init__(self) -> None:
+        """Initialize with zero counts."""
+        self.repaired_count = 0
+        self.invalid_count = 0
+        self.unmatched_count = 0
+        self.requested_line_count = 0
+
+    @require(lambda requested_line_count: requested_line_count >= 0)
+    def add(self, validator: AnswerValidator, requested_line_count: int) -> None:
+        """Add the counts of the ``validator`` and of the re-requested lines."""
+        self.repaired_count += validator.repaired_count
+        self.invalid_count += validator.invalid_count
+        self.unmatched_count += validator.unmatched_count
+        self.requested_line_count += requested_line_count
@@ -0,0 +1,103 @@
+"""Persist the words which we already have flash cards for."""
+
+import pathlib
+import re
+import sqlite3
+import unicodedata
+from typing import Container, Iterable, Iterator, List
+
+
+def normalize_word(word: str) -> str:
+    """
+    Normalize the ``word`` so that the trivially different spellings coincide.
+
+    >>> normalize_word(" Дом ")
+    'дом'
+    """
+    return unicodedata.normalize("NFC", word.strip()).casefold()
+
+
+WORD_RE = re.compile(r"[^\W\d_]+(?:[-'’][^\W\d_]+)*")
+
+
+def tokenize(line: str) -> List[str]:
+    """
+    Split the ``line`` into normalized words, ignoring the numbers and punctuation.
+
+    >>> tokenize("Кот-д'Ивуар: 42 КОТА!")
+    ["кот-д'ивуар", 'кота']
+    """
+    return [normalize_word(match.group(0)) for match in WORD_RE.finditer(line)]
+
+
+def is_known_line(line: str, known: Container[str]) -> bool:
+    """
+    Check that every word of the ``line`` is ``known``.
+
+    The lines without any words are considered known as there is nothing to learn.
+
+    >>> is_known_line("Дом, дом!", {"дом"})
+    True
+    >>> is_known_line("Мой дом.", {"дом"})
+    False
+    """
+    return all(word in known for word in tokenize(line))
+
+
+class KnownWords:
+    """Store the known words per source language in SQLite."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        """
+        Open or create the store.
+
+        :param path: to the SQLite database
+        """
+        self.path = path
+
+        # NOTE (mristin):
+        # The store is handed over to the writer thread, but it is never used
+        # concurrently.
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS known_words ("
+            "language TEXT NOT NULL, "
+            "word TEXT NOT NULL, "
+            "PRIMARY KEY (language, word))"
+        )
+        self._connection.commit()
+
+    def iterate(self, language: str) -> Iterator[str]:
+        """Iterate over all the normalized known words of the ``language``."""
+        cursor = self._connection.execute(
+            "SELECT word FROM known_words WHERE language = ?", (language,)
+        )
+        for (word,) in cursor:
+            assert isinstance(word, str)
+            yield word
+
+    def add(self, language: str, words: Iterable[str]) -> int:
+        """
+        Add the ``words`` of the ``language`` to the store.
+
+        The words are normalized before they are stored.
+
+        Return the number of the newly added words.
+        """
+        before = self._connection.total_changes
+
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO known_words(language, word) VALUES (?, ?)",
+            (
+                (language, normalized)
+                for normalized in (normalize_word(word) for word in words)
+                if normalized != ""
+            ),
+        )
+        self._connection.commit()
+
+        return self._connection.total_changes - before
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        self._connection.close()
@@ -0,0 +1,255 @@
+"""Write the output in groups on a background thread."""
+
+import queue
+import threading
+import time
+from typing import Callable, Generic, List, Optional, Sequence, TypeVar, Union
+
+from icontract import require
+
+from extractflashcards import sinks
+
+T = TypeVar("T")
+
+
+class _Rows:
+    """Carry the rows to be written to the sink."""
+
+    def __init__(self, rows: Sequence[Sequence[str]]) -> None:
+        self.rows = rows
+
+
+class _Completion(Generic[T]):
+    """Carry an item to be committed once the rows before it are flushed."""
+
+    def __init__(self, item: T) -> None:
+        self.item = item
+
+
+class _Stop:
+    """Signal the writer thread to commit and stop."""
+
+
+class GroupCommitWriter(Generic[T]):
+    """
+    Write the rows to the sink on a background thread and commit them in groups.
+
+    The sink is flushed only once at least ``flush_rows`` rows have been written,
+    or ``flush_interval`` seconds have passed since the first uncommitted row or
+    completion, and always on :py:meth:`close`. After each flush, the completions
+    submitted so far are passed on to ``on_commit``, so that they are never
+    committed before their rows. If the flush of the sink is not durable
+    (see :py:attr:`sinks.Sink.durable_flush`), the completions are held back, and
+    the sink is closed on :py:meth:`close` before they are committed.
+
+    The sink and whatever ``on_commit`` touches are used exclusively by
+    the writer thread until :py:meth:`close` returns. The same holds for
+    the timings :py:attr:`write_time` and :py:attr:`commit_time`.
+
+    >>> class MemorySink(sinks.Sink):
+    ...     def __init__(self, events, durable_flush=True):
+    ...         self.events = events
+    ...         self.durable_flush = durable_flush
+    ...     def write(self, rows):
+    ...         if rows[0][0] == "":
+    ...             raise ValueError("Unexpected empty word")
+    ...         self.events.extend(f"write {row[0]}" for row in rows)
+    ...     def flush(self):
+    ...         self.events.append("flush")
+    ...     def close(self):
+    ...         self.events.append("close")
+
+    The completions are committed after their rows have been flushed:
+
+    >>> events = []
+    >>> writer = GroupCommitWriter(
+    ...     sink=MemorySink(events),
+    ...     on_commit=lambda items: events.append(f"commit {items}"),
+    ...     flush_interval=60.0,
+    ...     flush_rows=2,
+    ... )
+    >>> writer.write([["дом"]])
+    >>> writer.complete(1)
+    >>> writer.write([["кот"]])
+    >>> writer.complete(2)
+    >>> writer.close()
+    >>> events
+    ['write дом', 'write кот', 'flush', 'commit [1]', 'flush', 'commit [2]']
+
+    The completions are held back until a non-durable sink is closed:
+
+    >>> events = []
+    >>> writer = GroupCommitWriter(
+    ...     sink=MemorySink(events, durable_flush=False),
+    ...     on_commit=lambda items: events.append(f"commit {items}"),
+    ...     flush_interval=60.0,
+    ...     flush_rows=1,
+    ... )
+    >>> writer.write([["дом"]])
+    >>> writer.complete(1)
+    >>> writer.write([["кот"]])
+    >>> writer.complete(2)
+    >>> writer.close()
+    >>> events
+    ['write дом', 'flush', 'write кот', 'flush', 'close', 'commit [1, 2]']
+
+    The error of the writer thread is re-raised on :py:meth:`close`:
+
+    >>> writer = GroupCommitWriter(
+    ...     sink=MemorySink([]),
+    ...     on_commit=lambda items: None,
+    ...     flush_interval=60.0,
+    ...     flush_rows=1,
+    ... )
+    >>> writer.write([[""]])
+    >>> writer.close()
+    Traceback (most recent call last):
+    ...
+    ValueError: Unexpected empty word
+    """
+
+    @require(lambda flush_interval: flush_interval >= 0.0)
+    @require(lambda flush_rows: flush_rows > 0)
+    def __init__(
+        self,
+        sink: sinks.Sink,
+        on_commit: Callable[[List[T]], None],
+        flush_interval: float,
+        flush_rows: int,
+    ) -> None:
+        """
+        Start the writer thread.
+
+        :param sink: where to write the rows
+        :param on_commit: called with the completions after every flush
+        :param flush_interval: maximum delay of a flush in seconds
+        :param flush_rows: number of rows which trigger a flush
+        """
+        self.sink = sink
+        self.on_commit = on_commit
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+
+        self.flush_count = 0
+
+        #: Seconds spent writing and flushing the sink
+        self.write_time = 0.0
+
+        #: Seconds spent in ``on_commit``
+        self.commit_time = 0.0
+
+        # NOTE (mristin):
+        # The queue is bounded so that the producers slow down if the disk can not
+        # keep up.
+        self._queue = queue.Queue(
+            maxsize=1024
+        )  # type: queue.Queue[Union[_Rows, _Completion[T], _Stop]]
+        self._error = None  # type: Optional[Exception]
+        self._closed = False
+
+        self._thread = threading.Thread(
+            target=self._run, name="group-commit-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _check(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def write(self, rows: Sequence[Sequence[str]]) -> None:
+        """Queue the ``rows`` for writing."""
+        self._check()
+        if len(rows) > 0:
+            self._queue.put(_Rows(rows))
+
+    def complete(self, item: T) -> None:
+        """Queue the ``item`` to be committed after the rows written so far."""
+        self._check()
+        self._queue.put(_Completion(item))
+
+    def close(self) -> None:
+        """
+        Commit everything queued so far and stop the writer thread.
+
+        Raise the error of the writer thread, if any, on the first call.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.put(_Stop())
+        self._thread.join()
+
+        self._check()
+
+    def _run(self) -> None:
+        pending = []  # type: List[T]
+        row_count = 0
+        deadline = None  # type: Optional[float]
+
+        def commit(final: bool) -> None:
+            nonlocal pending, row_count, deadline
+
+            start = time.perf_counter()
+            if final and not self.sink.durable_flush:
+                self.sink.close()
+            else:
+                self.sink.flush()
+            self.flush_count += 1
+            self.write_time += time.perf_counter() - start
+
+            if len(pending) > 0 and (final or self.sink.durable_flush):
+                start = time.perf_counter()
+                self.on_commit(pending)
+                self.commit_time += time.perf_counter() - start
+
+                pending = []
+
+            row_count = 0
+            deadline = None
+
+        while True:
+            timeout = (
+                None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+
+            try:
+                message = self._queue.get(
+                    timeout=timeout
+                )  # type: Optional[Union[_Rows, _Completion[T], _Stop]]
+            except queue.Empty:
+                message = None
+
+            if self._error is not None:
+                # NOTE (mristin):
+                # We keep on draining the queue after a failure so that
+                # the producers do not block before they notice it.
+                if isinstance(message, _Stop):
+                    return
+
+                continue
+
+            try:
+                if isinstance(message, _Stop):
+                    commit(final=True)
+                    return
+
+                if isinstance(message, _Rows):
+                    start = time.perf_counter()
+                    self.sink.write(message.rows)
+                    self.write_time += time.perf_counter() - start
+
+                    row_count += len(message.rows)
+                elif isinstance(message, _Completion):
+                    pending.append(message.item)
+
+                if message is not None and deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+                if row_count >= self.flush_rows or (
+                    deadline is not None and time.monotonic() >= deadline
+                ):
+                    commit(final=False)
+            except Exception as exception:
+                self._error = exception
+                deadline = None
@@ -45,6 +45,15 @@ setup(
             "mypy==1.8.0",
             "pylint==3.0.3",
         ],
+        "tokenizer": [
+            "tiktoken>=0.5.2",
+        ],
+        "zstd": [
+            "zstandard>=0.22.0",
+        ],
+        "parquet": [
+            "pyarrow>=14.0.0",
+        ],
     },
     py_modules=["extractflashcards"],
     packages=find_packages(exclude=["continuous_integration"]),
@@ -55,6 +64,7 @@ setup(
         "console_scripts": [
             "extract-flash-cards=extractflashcards.main:entry_point",
             "csv-to-anki=extractflashcards.csv_to_anki:entry_point",
+            "import-known-words=extractflashcards.import_known_words:entry_point",
         ]
     },
 )